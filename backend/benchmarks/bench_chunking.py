@@ -0,0 +1,147 @@
+# Micro-benchmark: single-pass chunker (chunking.py) vs. the previous string-concatenation
+# implementation, over large synthetic documents. Also asserts both produce identical chunks.
+#
+#   cd backend && python benchmarks/bench_chunking.py --pages 2000 --repeat 3
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import split_text, split_text_by_sections, chunk_document, SECTION_PATTERN
+
+WORDS = ("model data training results analysis method network layer input output section table "
+         "figure experiment evaluation dataset accuracy performance baseline proposed approach").split()
+
+
+# --- previous implementation, kept verbatim as the reference ---
+
+def legacy_split_text(text, max_len=800, min_len=200):
+    lines = re.split(r'\n+', text)
+    chunks = []
+    current_chunk = ""
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        if len(current_chunk) + len(line) < max_len:
+            current_chunk += line + "\n"
+        else:
+            if len(current_chunk.strip()) >= min_len:
+                chunks.append(current_chunk.strip())
+            current_chunk = line + "\n"
+
+    if len(current_chunk.strip()) >= min_len:
+        chunks.append(current_chunk.strip())
+
+    return chunks
+
+
+def legacy_split_text_by_sections(text, max_len=800, min_len=200):
+    matches = list(SECTION_PATTERN.finditer(text))
+
+    chunks = []
+    for i, match in enumerate(matches):
+        start = match.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        section_text = text[start:end].strip()
+
+        sub_chunks = legacy_split_text(section_text, max_len=max_len, min_len=min_len)
+        chunks.extend(sub_chunks)
+
+    return chunks
+
+
+def legacy_guess_document_type(text: str) -> str:
+    text_lower = text.lower()
+
+    academic_keywords = ["introduction", "experiment", "conclusion", "related work", "results", "evaluation", "dataset"]
+    report_keywords = ["executive summary", "table of contents", "methodology", "findings", "objective", "recommendations"]
+    manual_keywords = ["step 1", "usage:", "how to", "install", "instruction", "follow these steps"]
+    legal_keywords = ["agreement", "terms and conditions", "clause", "party", "shall", "warranty", "liability", "indemnify"]
+
+    if re.search(r'\b\d+(\.\d+)*\s+[A-Z]', text) and any(kw in text_lower for kw in academic_keywords):
+        return "academic"
+    if any(kw in text_lower for kw in report_keywords):
+        return "report"
+    if any(kw in text_lower for kw in manual_keywords):
+        return "manual"
+    if any(kw in text_lower for kw in legal_keywords):
+        return "legal"
+    return "general"
+
+
+def legacy_chunk_document(text):
+    # guess_document_type + the academic check in embed_and_store_individual: two regex passes
+    doc_type = legacy_guess_document_type(text)
+    if doc_type == "academic" and bool(re.search(r'\b\d+(\.\d+)*\s+[A-Z]', text)):
+        return legacy_split_text_by_sections(text)
+    return legacy_split_text(text)
+
+
+def synthetic_document(pages, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    section = 0
+    for page in range(pages):
+        if page % 3 == 0:
+            section += 1
+            lines.append(f"{section} Results Of Experiment {section}")
+        for _ in range(rng.randint(25, 40)):
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 16)))
+            lines.append(("  " if rng.random() < 0.1 else "") + line)
+            if rng.random() < 0.15:
+                lines.append("")
+        lines.append(f"Page {page + 1}")
+    return "\n".join(lines)
+
+
+def best_of(fn, text, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(pages_list, repeat):
+    results = []
+    for pages in pages_list:
+        text = synthetic_document(pages)
+        cases = [
+            ("split_text", legacy_split_text, split_text),
+            ("split_text_by_sections", legacy_split_text_by_sections, split_text_by_sections),
+            ("chunk_document", legacy_chunk_document, lambda t: [c["chunk"] for c in chunk_document(t)[1]]),
+        ]
+        for name, legacy, current in cases:
+            legacy_time, legacy_chunks = best_of(legacy, text, repeat)
+            current_time, current_chunks = best_of(current, text, repeat)
+            assert legacy_chunks == current_chunks, f"{name}: chunk output differs at {pages} pages"
+            results.append({
+                "case": name,
+                "pages": pages,
+                "chars": len(text),
+                "chunks": len(current_chunks),
+                "legacy_s": round(legacy_time, 4),
+                "current_s": round(current_time, 4),
+                "speedup": round(legacy_time / current_time, 2) if current_time else None,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.pages, args.repeat), indent=2))
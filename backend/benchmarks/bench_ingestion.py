@@ -0,0 +1,55 @@
+# Ingestion throughput: synthetic PDFs through store_embedding_for_pdf, in-process.
+#
+#   cd backend && python benchmarks/bench_ingestion.py --docs 10 --pages 20
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import use_workdir, generate_pdfs, latency_summary, run_info, write_results
+
+
+def run(docs, pages, seed=0, workdir=None):
+    workdir = use_workdir(workdir)
+    pdf_paths = generate_pdfs(os.path.join(workdir, "data", "pdfs"), docs, pages, seed=seed)
+
+    # imported after chdir: the backend resolves data/ relative to the working directory
+    from embeddings import store_embedding_for_pdf, load_individual_index
+
+    # warm-up: the first encode pays for model loading
+    store_embedding_for_pdf(pdf_paths[0])
+
+    per_doc = []
+    chunks = 0
+    start = time.perf_counter()
+    for path in pdf_paths:
+        doc_start = time.perf_counter()
+        store_embedding_for_pdf(path)
+        per_doc.append(time.perf_counter() - doc_start)
+        chunks += len(load_individual_index(os.path.basename(path))[1])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "benchmark": "ingestion",
+        "docs": docs,
+        "pages_per_doc": pages,
+        "stored_chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(docs * pages / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 2),
+        "per_doc": latency_summary(per_doc),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=os.path.abspath)
+    args = parser.parse_args()
+
+    write_results({"run": run_info(), "results": [run(args.docs, args.pages, args.seed)]}, args.output)
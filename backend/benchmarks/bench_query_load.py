@@ -0,0 +1,131 @@
+# End-to-end /query/ latency under concurrent load. Starts the fake OpenAI server and a
+# backend process in a throwaway data directory, uploads synthetic PDFs, then fires queries
+# with a fixed concurrency and reports p50/p90/p99.
+#
+#   cd backend && python benchmarks/bench_query_load.py --docs 5 --pages 10 --requests 200 --concurrency 16
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from common import BACKEND_DIR, use_workdir, generate_pdfs, latency_summary, run_info, write_results
+from bench_search import QUERIES
+
+
+def start_process(args, env, cwd):
+    return subprocess.Popen(args, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(url, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def fire(base_url, filenames, requests, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    timings = []
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def one(i):
+            nonlocal errors
+            data = {"query": QUERIES[i % len(QUERIES)], "files": filenames}
+            async with slots:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/query/", data=data)
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return timings, errors, elapsed
+
+
+def run(docs, pages, requests, concurrency, llm_latency_ms, llm_jitter_ms, backend_port=8010, llm_port=8100, seed=0, workdir=None):
+    workdir = use_workdir(workdir)
+    pdf_paths = generate_pdfs(os.path.join(workdir, "bench_pdfs"), docs, pages, seed=seed)
+
+    env = dict(os.environ,
+               OPENAI_API_KEY="fake",
+               OPENAI_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+               FAKE_OPENAI_LATENCY_MS=str(llm_latency_ms),
+               FAKE_OPENAI_JITTER_MS=str(llm_jitter_ms),
+               LOG_LEVEL="WARNING")
+    processes = [
+        start_process([sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_openai.py"), "--port", str(llm_port),
+                       "--latency-ms", str(llm_latency_ms), "--jitter-ms", str(llm_jitter_ms)], env, workdir),
+        start_process([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+                       "--port", str(backend_port), "--log-level", "warning"], env, workdir),
+    ]
+    base_url = f"http://127.0.0.1:{backend_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{llm_port}/stats")
+        wait_until_up(f"{base_url}/health")
+
+        upload_start = time.perf_counter()
+        for path in pdf_paths:
+            with open(path, "rb") as f:
+                httpx.post(f"{base_url}/upload/", files=[("files", (os.path.basename(path), f, "application/pdf"))], timeout=600)
+        upload_seconds = time.perf_counter() - upload_start
+
+        filenames = [os.path.basename(path) for path in pdf_paths]
+        asyncio.run(fire(base_url, filenames, min(concurrency, requests), concurrency))  # warm-up
+        timings, errors, elapsed = asyncio.run(fire(base_url, filenames, requests, concurrency))
+        llm_stats = httpx.get(f"http://127.0.0.1:{llm_port}/stats").json()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    return {
+        "benchmark": "query_load",
+        "docs": docs,
+        "pages_per_doc": pages,
+        "requests": requests,
+        "concurrency": concurrency,
+        "llm_latency_ms": llm_latency_ms,
+        "upload_seconds": round(upload_seconds, 3),
+        "errors": errors,
+        "throughput_rps": round(len(timings) / elapsed, 2) if elapsed else None,
+        "llm_requests": llm_stats["requests"],
+        "llm_max_in_flight": llm_stats["max_in_flight"],
+        **latency_summary(timings),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=os.path.abspath)
+    args = parser.parse_args()
+
+    result = run(args.docs, args.pages, args.requests, args.concurrency, args.llm_latency_ms, args.llm_jitter_ms, seed=args.seed)
+    write_results({"run": run_info(), "results": [result]}, args.output)
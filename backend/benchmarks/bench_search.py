@@ -0,0 +1,61 @@
+# Search latency versus corpus size: the corpus grows in steps and search_unified is timed
+# over all documents at each size, per search mode.
+#
+#   cd backend && python benchmarks/bench_search.py --sizes 1 5 20 --pages 20 --queries 30
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import use_workdir, generate_pdfs, latency_summary, run_info, write_results
+
+QUERIES = [
+    "what dataset was used for the evaluation?",
+    "summarize the results of the experiments",
+    "how does the proposed approach compare to the baseline?",
+    "what accuracy does the transformer classifier reach?",
+    "Results Of Experiment 4",
+    "\"attention layer\" benchmark",
+]
+
+
+def run(sizes, pages, queries, modes=("dense", "lexical", "hybrid"), seed=0, workdir=None):
+    workdir = use_workdir(workdir)
+    pdf_paths = generate_pdfs(os.path.join(workdir, "data", "pdfs"), max(sizes), pages, seed=seed)
+
+    from embeddings import store_embedding_for_pdf, search_unified
+
+    results = []
+    ingested = 0
+    for size in sorted(sizes):
+        for path in pdf_paths[ingested:size]:
+            store_embedding_for_pdf(path)
+        ingested = size
+        filenames = [os.path.basename(path) for path in pdf_paths[:size]]
+
+        for mode in modes:
+            search_unified(QUERIES[0], filenames, top_k=50, mode=mode)  # warm-up
+            timings = []
+            for i in range(queries):
+                start = time.perf_counter()
+                search_unified(QUERIES[i % len(QUERIES)], filenames, top_k=50, mode=mode)
+                timings.append(time.perf_counter() - start)
+            results.append({"benchmark": "search", "corpus_docs": size, "pages_per_doc": pages,
+                            "mode": mode, **latency_summary(timings)})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--modes", nargs="+", default=["dense", "lexical", "hybrid"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=os.path.abspath)
+    args = parser.parse_args()
+
+    write_results({"run": run_info(), "results": run(args.sizes, args.pages, args.queries, args.modes, args.seed)}, args.output)
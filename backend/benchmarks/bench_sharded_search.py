@@ -0,0 +1,117 @@
+# Sharded search with local processes: starts N shard backends (each with its own data
+# directory), a coordinator pointing at them and, for reference, one unsharded backend. The
+# same synthetic PDFs are uploaded to both, then /search/ is timed against each and the
+# coordinator's results are compared with the single node's. With --kill-shard the last shard
+# is stopped before a second round, to check the coordinator degrades instead of failing.
+#
+#   cd backend && python benchmarks/bench_sharded_search.py --shards 3 --docs 9 --pages 10 --queries 30 --kill-shard
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from common import BACKEND_DIR, use_workdir, generate_pdfs, latency_summary, run_info, write_results
+from bench_query_load import start_process, wait_until_up
+from bench_search import QUERIES
+
+
+def start_backend(workdir, port, env):
+    os.makedirs(os.path.join(workdir, "data", "pdfs"), exist_ok=True)
+    return start_process([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+                          "--port", str(port), "--log-level", "warning"], env, workdir)
+
+
+def search_round(base_url, filenames, queries, mode, top_k):
+    timings = []
+    results = []
+    errors = 0
+    for i in range(queries):
+        data = {"query": QUERIES[i % len(QUERIES)], "search_mode": mode, "top_k": str(top_k), "files": filenames}
+        start = time.perf_counter()
+        response = httpx.post(f"{base_url}/search/", data=data, timeout=60)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors += 1
+            results.append([])
+            continue
+        results.append([(r["filename"], r.get("start"), r.get("chunk_index")) for r in response.json()["results"]])
+    return timings, results, errors
+
+
+def overlap(results, reference, k):
+    # mean fraction of the reference top-k that the other run also returned in its top-k
+    fractions = [len(set(got[:k]) & set(want[:k])) / len(want[:k]) for got, want in zip(results, reference) if want]
+    return round(sum(fractions) / len(fractions), 4) if fractions else None
+
+
+def run(shards, docs, pages, queries, mode="hybrid", top_k=20, kill_shard=False, base_port=8200, seed=0, workdir=None):
+    workdir = use_workdir(workdir)
+    pdf_paths = generate_pdfs(os.path.join(workdir, "bench_pdfs"), docs, pages, seed=seed)
+    filenames = [os.path.basename(path) for path in pdf_paths]
+
+    env = dict(os.environ, LOG_LEVEL="WARNING", SHARD_NODES="")
+    shard_urls = [f"http://127.0.0.1:{base_port + 1 + i}" for i in range(shards)]
+    shard_processes = [start_backend(os.path.join(workdir, f"shard{i}"), base_port + 1 + i, env) for i in range(shards)]
+    single = start_backend(os.path.join(workdir, "single"), base_port + shards + 1, env)
+    coordinator = start_backend(os.path.join(workdir, "coordinator"), base_port,
+                                dict(env, SHARD_NODES=",".join(shard_urls)))
+    processes = shard_processes + [single, coordinator]
+    coordinator_url = f"http://127.0.0.1:{base_port}"
+    single_url = f"http://127.0.0.1:{base_port + shards + 1}"
+
+    results = []
+    try:
+        for url in shard_urls + [single_url, coordinator_url]:
+            wait_until_up(f"{url}/health")
+
+        placement = {}
+        for path in pdf_paths:
+            for url in (coordinator_url, single_url):
+                with open(path, "rb") as f:
+                    response = httpx.post(f"{url}/upload/", files=[("files", (os.path.basename(path), f, "application/pdf"))], timeout=600)
+                if url == coordinator_url:
+                    info = response.json()["uploaded_files_info"][0]
+                    placement[info.get("shard")] = placement.get(info.get("shard"), 0) + 1
+
+        search_round(single_url, filenames, 2, mode, top_k)  # warm-up
+        search_round(coordinator_url, filenames, 2, mode, top_k)
+        single_timings, reference, _ = search_round(single_url, filenames, queries, mode, top_k)
+        rounds = [("all_shards", None)] + ([("one_shard_down", shard_processes[-1])] if kill_shard else [])
+        for case, victim in rounds:
+            if victim is not None:
+                victim.terminate()
+                victim.wait(timeout=30)
+            timings, sharded, errors = search_round(coordinator_url, filenames, queries, mode, top_k)
+            results.append({"benchmark": "sharded_search", "case": case, "mode": mode, "shards": shards, "docs": docs,
+                            "pages_per_doc": pages, "errors": errors, f"overlap_at_{top_k}": overlap(sharded, reference, top_k),
+                            "docs_per_shard": sorted(placement.values()), **latency_summary(timings)})
+        results.append({"benchmark": "sharded_search", "case": "single_node", "mode": mode, "shards": 1, "docs": docs,
+                        "pages_per_doc": pages, **latency_summary(single_timings)})
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--docs", type=int, default=9)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--mode", default="hybrid", choices=["dense", "lexical", "hybrid"])
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--kill-shard", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=os.path.abspath)
+    args = parser.parse_args()
+
+    results = run(args.shards, args.docs, args.pages, args.queries, args.mode, args.top_k, args.kill_shard, seed=args.seed)
+    write_results({"run": run_info(), "results": results}, args.output)
@@ -0,0 +1,101 @@
+# Shared helpers for the benchmark scripts: synthetic PDFs, isolated work directories,
+# percentiles and result files.
+
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("model data training results analysis method network layer input output section table "
+         "figure experiment evaluation dataset accuracy performance baseline proposed approach "
+         "sentiment review classifier corpus token embedding attention transformer benchmark").split()
+
+
+def use_workdir(path=None):
+    # the backend writes to relative data/ paths: run it from a throwaway directory
+    workdir = path or tempfile.mkdtemp(prefix="docinsight-bench-")
+    os.makedirs(os.path.join(workdir, "data", "pdfs"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "data", "embeddings"), exist_ok=True)
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return workdir
+
+
+def synthetic_page(rng, page_number, section):
+    lines = ["ACME Research Report - Confidential"]  # header boilerplate, repeated on every page
+    if section is not None:
+        lines.append(f"{section} Results Of Experiment {section}")
+    for _ in range(rng.randint(25, 35)):
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))))
+    lines.append(f"Page {page_number}")
+    return "\n".join(lines)
+
+
+def generate_pdfs(out_dir, count, pages, seed=0):
+    # count PDFs of `pages` pages each, written with PyMuPDF; returns their paths
+    import fitz
+
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for doc_number in range(count):
+        doc = fitz.open()
+        for page_number in range(1, pages + 1):
+            section = (page_number + 2) // 3 if page_number % 3 == 1 else None
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 560, 800), synthetic_page(rng, page_number, section), fontsize=8)
+        path = os.path.join(out_dir, f"synthetic_{seed}_{doc_number:03d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
+
+
+def percentile(values, pct):
+    # nearest-rank percentile
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100.0 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def latency_summary(seconds):
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2) if seconds else None,
+        "p90_ms": round(percentile(seconds, 90) * 1000, 2) if seconds else None,
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2) if seconds else None,
+        "max_ms": round(max(seconds) * 1000, 2) if seconds else None,
+    }
+
+
+def run_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(results, output=None):
+    text = json.dumps(results, indent=2, default=str)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,45 @@
+# Compares two benchmark JSON files written by run_all.py (or any single bench_*.py script).
+#
+#   python benchmarks/compare.py before.json after.json
+
+import argparse
+import json
+
+# fields that identify a result row rather than measure it
+KEY_FIELDS = ("benchmark", "case", "mode", "shards", "pages", "docs", "corpus_docs", "pages_per_doc", "concurrency", "requests")
+
+
+def row_key(row):
+    return tuple((field, row[field]) for field in KEY_FIELDS if field in row)
+
+
+def compare(before, after):
+    before_rows = {row_key(row): row for row in before["results"]}
+    lines = []
+    for row in after["results"]:
+        key = row_key(row)
+        old = before_rows.get(key)
+        label = " ".join(f"{field}={value}" for field, value in key)
+        if old is None:
+            lines.append(f"{label}: new")
+            continue
+        for metric, value in row.items():
+            if metric in KEY_FIELDS or not isinstance(value, (int, float)) or not isinstance(old.get(metric), (int, float)):
+                continue
+            previous = old[metric]
+            change = f"{(value - previous) / previous * 100:+.1f}%" if previous else "n/a"
+            lines.append(f"{label} {metric}: {previous} -> {value} ({change})")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print("\n".join(compare(before, after)))
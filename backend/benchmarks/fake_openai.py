@@ -0,0 +1,72 @@
+# Local stand-in for the OpenAI chat completions API, with configurable latency.
+# Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake.
+#
+#   python benchmarks/fake_openai.py --port 8100 --latency-ms 800 --jitter-ms 200
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "500"))
+JITTER_MS = float(os.getenv("FAKE_OPENAI_JITTER_MS", "100"))
+COMPLETION_TOKENS = int(os.getenv("FAKE_OPENAI_COMPLETION_TOKENS", "200"))
+
+app = FastAPI()
+stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        delay = max(LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS), 0) / 1000.0
+        await asyncio.sleep(delay)
+    finally:
+        stats["in_flight"] -= 1
+
+    prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+    content = " ".join(["lorem"] * COMPLETION_TOKENS)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": COMPLETION_TOKENS,
+            "total_tokens": prompt_chars // 4 + COMPLETION_TOKENS,
+        },
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    args = parser.parse_args()
+
+    LATENCY_MS = args.latency_ms
+    JITTER_MS = args.jitter_ms
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,45 @@
+# Runs the ingestion, search and query-load benchmarks with one set of parameters and writes
+# a single JSON document. Compare two runs with benchmarks/compare.py.
+#
+#   cd backend && python benchmarks/run_all.py --output bench.json
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import run_info, write_results
+import bench_chunking
+import bench_ingestion
+import bench_search
+import bench_query_load
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--search-sizes", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--search-queries", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["chunking", "ingestion", "search", "query_load"])
+    parser.add_argument("--output", type=os.path.abspath)  # benchmarks chdir into a temp dir
+    args = parser.parse_args()
+
+    results = []
+    if "chunking" not in args.skip:
+        results.extend(bench_chunking.run([args.pages * args.docs], repeat=3))
+    if "ingestion" not in args.skip:
+        results.append(bench_ingestion.run(args.docs, args.pages, seed=args.seed))
+    if "search" not in args.skip:
+        results.extend(bench_search.run(args.search_sizes, args.pages, args.search_queries, seed=args.seed))
+    if "query_load" not in args.skip:
+        results.append(bench_query_load.run(args.docs, args.pages, args.requests, args.concurrency,
+                                            args.llm_latency_ms, args.llm_latency_ms / 5, seed=args.seed))
+
+    params = {key: value for key, value in vars(args).items() if key != "output"}
+    write_results({"run": run_info(), "params": params, "results": results}, args.output)
@@ -0,0 +1,95 @@
+import math
+import re
+import heapq
+from collections import Counter, defaultdict
+
+# Okapi BM25 over the chunks of a single document.
+# Built once at ingestion time and pickled next to the .faiss file, so keyword
+# lookups (identifiers, clause numbers, dataset names) are a postings scan
+# instead of a model forward pass.
+
+K1 = 1.5
+B = 0.75
+RRF_K = 60  # reciprocal rank fusion constant, 60 is the value from the original RRF paper
+
+# words, plus compound identifiers such as "4.2", "gpt-4", "w19-6120", "top_k"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+IDENTIFIER_PATTERN = re.compile(r"\d|[._\-/]")
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        # also index the parts of a compound token so "bert-base" matches "bert base"
+        if IDENTIFIER_PATTERN.search(token):
+            parts = re.split(r"[._\-/]", token)
+            if len(parts) > 1:
+                tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def build_bm25_index(chunks: list, k1: float = K1, b: float = B) -> dict:
+    postings = defaultdict(list)
+    doc_lens = []
+
+    for chunk_id, chunk in enumerate(chunks):
+        term_freqs = Counter(tokenize(chunk))
+        doc_lens.append(sum(term_freqs.values()))
+        for term, tf in term_freqs.items():
+            postings[term].append((chunk_id, tf))
+
+    n_docs = len(doc_lens)
+    return {
+        "postings": dict(postings),
+        "doc_lens": doc_lens,
+        "avgdl": (sum(doc_lens) / n_docs) if n_docs else 0.0,
+        "n_docs": n_docs,
+        "k1": k1,
+        "b": b,
+    }
+
+
+def bm25_search(bm25_index: dict, query_terms: list, top_k: int = 50) -> list:
+    if not bm25_index or not bm25_index["n_docs"] or not query_terms:
+        return []
+
+    postings = bm25_index["postings"]
+    doc_lens = bm25_index["doc_lens"]
+    avgdl = bm25_index["avgdl"] or 1.0
+    n_docs = bm25_index["n_docs"]
+    k1 = bm25_index["k1"]
+    b = bm25_index["b"]
+
+    scores = defaultdict(float)
+    for term in set(query_terms):
+        term_postings = postings.get(term)
+        if not term_postings:
+            continue
+        df = len(term_postings)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for chunk_id, tf in term_postings:
+            norm = k1 * (1 - b + b * doc_lens[chunk_id] / avgdl)
+            scores[chunk_id] += idf * tf * (k1 + 1) / (tf + norm)
+
+    return heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    # rankings: list of ranked key lists (best first). returns [(key, fused_score)] best first
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def is_keyword_query(query: str, stop_words=frozenset()) -> bool:
+    # keyword-heavy: quoted phrases, or at least half of the content words are identifiers
+    if re.search(r'"[^"]+"', query):
+        return True
+    words = [w for w in TOKEN_PATTERN.findall(query.lower()) if w not in stop_words]
+    if not words:
+        return False
+    identifiers = [w for w in words if IDENTIFIER_PATTERN.search(w)]
+    return len(identifiers) * 2 >= len(words)
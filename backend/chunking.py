@@ -0,0 +1,130 @@
+import re
+from bisect import bisect_right
+from observability import timed
+
+# Single-pass chunker. Lines are scanned once while tracking their offsets in the original
+# text, so every chunk knows where it came from and nothing is re-concatenated or re-stripped.
+# split_text / split_text_by_sections return exactly what they always did.
+
+CHUNK_MAX_LEN = 800
+CHUNK_MIN_LEN = 200
+
+HAS_SECTIONS_PATTERN = re.compile(r'\b\d+(\.\d+)*\s+[A-Z]')
+SECTION_PATTERN = re.compile(r'''
+    ^                           # 줄 시작
+    (
+        (?:\d+(?:\.\d+)*)       # 1, 1.1, 1.1.1
+        |(?:[IVXLCDM]+)         # Roman numerals (I, II, III,)
+    )
+    [\.\)\:\s]*                 # separator (dot, colon, space)
+    [A-Z][^\n]{3,80}            # Uppercase, max 80 chars
+    $
+''', re.MULTILINE | re.VERBOSE)
+
+ACADEMIC_KEYWORDS = ["introduction", "experiment", "conclusion", "related work", "results", "evaluation", "dataset"]
+REPORT_KEYWORDS = ["executive summary", "table of contents", "methodology", "findings", "objective", "recommendations"]
+MANUAL_KEYWORDS = ["step 1", "usage:", "how to", "install", "instruction", "follow these steps"]
+LEGAL_KEYWORDS = ["agreement", "terms and conditions", "clause", "party", "shall", "warranty", "liability", "indemnify"]
+
+
+def detect_document_type(text: str):
+    # returns (doc_type, has_sections); the section regex runs over the document once
+    text_lower = text.lower()
+    has_sections = bool(HAS_SECTIONS_PATTERN.search(text))
+
+    if has_sections and any(kw in text_lower for kw in ACADEMIC_KEYWORDS):
+        return "academic", has_sections
+    if any(kw in text_lower for kw in REPORT_KEYWORDS):
+        return "report", has_sections
+    if any(kw in text_lower for kw in MANUAL_KEYWORDS):
+        return "manual", has_sections
+    if any(kw in text_lower for kw in LEGAL_KEYWORDS):
+        return "legal", has_sections
+    return "general", has_sections
+
+
+def guess_document_type(text: str) -> str:
+    return detect_document_type(text)[0]
+
+
+def split_text_spans(text, max_len=CHUNK_MAX_LEN, min_len=CHUNK_MIN_LEN, start=0, end=None):
+    # chunks of text[start:end] as {"chunk", "start", "end"}; start/end cover the first and
+    # last stripped line of the chunk in the original text
+    segment = text if start == 0 and end is None else text[start:end]
+
+    chunks = []
+    lines = []
+    length = 0  # length of the lines joined with a trailing "\n" each
+    chunk_start = chunk_end = start
+    offset = start
+
+    for raw in segment.split("\n"):
+        raw_start = offset
+        offset += len(raw) + 1
+        line = raw.strip()
+        if not line:
+            continue
+        line_start = raw_start if len(line) == len(raw) else raw_start + raw.find(line)
+
+        if length + len(line) < max_len:
+            if not lines:
+                chunk_start = line_start
+            lines.append(line)
+            length += len(line) + 1
+        else:
+            if max(length - 1, 0) >= min_len:
+                chunks.append({"chunk": "\n".join(lines), "start": chunk_start, "end": chunk_end})
+            lines = [line]
+            length = len(line) + 1
+            chunk_start = line_start
+        chunk_end = line_start + len(line)
+
+    if max(length - 1, 0) >= min_len:
+        chunks.append({"chunk": "\n".join(lines), "start": chunk_start, "end": chunk_end})
+
+    return chunks
+
+
+def split_text_by_sections_spans(text, max_len=CHUNK_MAX_LEN, min_len=CHUNK_MIN_LEN):
+    matches = list(SECTION_PATTERN.finditer(text))
+
+    chunks = []
+    for i, match in enumerate(matches):
+        start = match.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        chunks.extend(split_text_spans(text, max_len=max_len, min_len=min_len, start=start, end=end))
+
+    return chunks
+
+
+def split_text(text, max_len=CHUNK_MAX_LEN, min_len=CHUNK_MIN_LEN):
+    return [c["chunk"] for c in split_text_spans(text, max_len=max_len, min_len=min_len)]
+
+
+def split_text_by_sections(text, max_len=CHUNK_MAX_LEN, min_len=CHUNK_MIN_LEN):
+    return [c["chunk"] for c in split_text_by_sections_spans(text, max_len=max_len, min_len=min_len)]
+
+
+@timed("chunking")
+def chunk_document(text, page_starts=None, max_len=CHUNK_MAX_LEN, min_len=CHUNK_MIN_LEN):
+    # returns (doc_type, chunks); academic documents with numbered sections are split per section
+    doc_type, has_sections = detect_document_type(text)
+    if doc_type == "academic" and has_sections:
+        chunks = split_text_by_sections_spans(text, max_len=max_len, min_len=min_len)
+    else:
+        chunks = split_text_spans(text, max_len=max_len, min_len=min_len)
+
+    if page_starts:
+        for chunk in chunks:
+            chunk["page"] = page_for_offset(page_starts, chunk["start"])
+    return doc_type, chunks
+
+
+def page_for_offset(page_starts, offset):
+    # page_starts[i] is the character offset where page i + 1 begins
+    return max(bisect_right(page_starts, offset), 1)
+
+
+def chunk_text_from_span(text, start, end):
+    # rebuilds the chunk string exactly as the chunker produced it from its span
+    return "\n".join(line.strip() for line in text[start:end].split("\n") if line.strip())
@@ -0,0 +1,174 @@
+import asyncio
+import os
+
+import numpy as np
+
+from embeddings import (INDEX_DIR, STORE_CHUNK_TEXT, index_lock, corpus_lock, document_lock, create_index,
+                        load_individual_index, save_individual_index, load_document_refs, load_document_text,
+                        document_refs_by_referrer, is_deleted, tombstone_path, load_corpus_signatures,
+                        save_corpus_signatures)
+from chunking import chunk_text_from_span
+from executors import ingestion_executor, ExecutorSaturated
+from observability import Counter, METRICS, logger
+
+# Background compaction of tombstones.
+#
+# Deleting a document only drops a <name>.tombstone marker, and re-indexing a document keeps
+# rows that other documents still reference (DEDUP_ACROSS_CORPUS) as tombstoned rows. Search
+# skips both straight away; this task reclaims the space later. Rows other documents borrow
+# are first copied into those documents' own indexes (the vectors are reconstructed from
+# FAISS, nothing is re-embedded), then a deleted document's files are removed, or a document
+# whose tombstoned share passed COMPACTION_THRESHOLD is rewritten with its live rows only.
+#
+# Files are swapped with os.replace, so queries keep reading a complete old or new version
+# throughout; compaction runs on the ingestion executor, never alongside more than one upload.
+
+COMPACTION_INTERVAL = float(os.getenv("COMPACTION_INTERVAL", "300"))
+COMPACTION_THRESHOLD = float(os.getenv("COMPACTION_THRESHOLD", "0.2"))  # tombstoned share of a document's rows
+
+DOCUMENT_SUFFIXES = (".faiss", ".pkl", ".bm25.pkl", ".refs.pkl", ".txt")
+
+COMPACTED_DOCUMENTS = Counter("docinsight_compacted_documents_total", "Documents rewritten or removed by compaction")
+METRICS.append(COMPACTED_DOCUMENTS)
+
+
+def rehome_refs(referrer, target, target_index, target_metadata, signatures=None):
+    # copies the rows `referrer` borrows from `target` into referrer's own index and drops the
+    # refs; signatures limits which refs move (None: all of them). Returns how many moved.
+    with document_lock(referrer):
+        refs = load_document_refs(referrer)
+        moving = [ref for ref in refs if ref["filename"] == target and (signatures is None or ref["simhash"] in signatures)]
+        if not moving:
+            return 0
+
+        index, metadata = load_individual_index(referrer)
+        row_by_signature = {item.get("simhash"): row for row, item in enumerate(target_metadata)}
+        text = load_document_text(referrer) if STORE_CHUNK_TEXT else None
+        moved = []
+        for ref in moving:
+            row = row_by_signature.get(ref["simhash"])
+            if row is None or row >= target_index.ntotal:
+                logger.warning("Reference from %s to %s no longer resolves, dropping it", referrer, target)
+                continue
+            index.add(np.expand_dims(target_index.reconstruct(row), axis=0))
+            entry = {
+                "filename": referrer,
+                "doc_type": metadata[0]["doc_type"] if metadata else target_metadata[row].get("doc_type", "general"),
+                **{key: value for key, value in ref.items() if key != "filename"},
+            }
+            if text is not None:
+                entry["chunk"] = chunk_text_from_span(text, entry["start"], entry["end"])
+            metadata.append(entry)
+            moved.append(ref["simhash"])
+
+        save_individual_index(referrer, index, metadata, [ref for ref in refs if ref not in moving])
+        with corpus_lock:
+            signatures_by_file = load_corpus_signatures()
+            signatures_by_file.setdefault(referrer, []).extend(moved)  # the referrer owns these chunks now
+            save_corpus_signatures(signatures_by_file)
+    logger.info("Moved %d rows borrowed by %s out of %s", len(moved), referrer, target)
+    return len(moved)
+
+
+def remove_document_files(filename):
+    base_filename = filename.replace('.pdf', '')
+    with index_lock:
+        for suffix in DOCUMENT_SUFFIXES:
+            path = os.path.join(INDEX_DIR, f"{base_filename}{suffix}")
+            if os.path.exists(path):
+                os.remove(path)
+        os.remove(tombstone_path(filename))  # last: until here the document still counts as deleted
+
+
+def compact_document(filename) -> bool:
+    with document_lock(filename):
+        deleted = is_deleted(filename)
+        index, metadata = load_individual_index(filename)
+        dead = {row for row, item in enumerate(metadata) if deleted or item.get("deleted")}
+        if not dead and not deleted:
+            return False
+
+        live_signatures = {metadata[row].get("simhash") for row in range(len(metadata)) if row not in dead}
+        moving = {metadata[row].get("simhash") for row in dead} - live_signatures
+        for referrer, refs in document_refs_by_referrer().items():
+            if referrer != filename and any(ref["filename"] == filename for ref in refs):
+                rehome_refs(referrer, filename, index, metadata, None if deleted else moving)
+
+        if deleted:
+            remove_document_files(filename)
+            logger.info("Removed deleted document %s", filename)
+        else:
+            live_rows = [row for row in range(min(len(metadata), index.ntotal)) if row not in dead]
+            compacted = create_index()
+            if live_rows:
+                compacted.add(np.array([index.reconstruct(row) for row in live_rows], dtype="float32"))
+            save_individual_index(filename, compacted, [metadata[row] for row in live_rows], load_document_refs(filename))
+            logger.info("Compacted %s: dropped %d tombstoned rows, %d left", filename, len(dead), len(live_rows))
+    COMPACTED_DOCUMENTS.inc()
+    return True
+
+
+class Compactor:
+    def __init__(self, interval: float = COMPACTION_INTERVAL, threshold: float = COMPACTION_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.checked = {}  # filename -> metadata mtime when last found below the threshold
+        self.wake = None
+        self.task = None
+
+    def start(self):
+        self.wake = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def request(self):
+        # run soon instead of waiting for the next interval (after a delete)
+        if self.wake is not None:
+            self.wake.set()
+
+    def candidates(self, force: bool = False) -> list:
+        if not os.path.isdir(INDEX_DIR):
+            return []
+        found = []
+        for name in sorted(os.listdir(INDEX_DIR)):
+            if name.endswith(".tombstone"):
+                found.append(f"{name[:-len('.tombstone')]}.pdf")
+            elif name.endswith(".pkl") and not name.endswith((".bm25.pkl", ".refs.pkl")) and name != "corpus_simhash.pkl":
+                filename = f"{name[:-len('.pkl')]}.pdf"
+                mtime = os.stat(os.path.join(INDEX_DIR, name)).st_mtime_ns
+                if not force and self.checked.get(filename) == mtime:
+                    continue  # unchanged since it was last below the threshold
+                _, metadata = load_individual_index(filename)
+                dead = sum(1 for item in metadata if item.get("deleted"))
+                if dead and (force or dead / len(metadata) >= self.threshold):
+                    found.append(filename)
+                else:
+                    self.checked[filename] = mtime
+        return list(dict.fromkeys(found))
+
+    def compact(self, force: bool = False) -> list:
+        compacted = []
+        for filename in self.candidates(force):
+            try:
+                if compact_document(filename):
+                    compacted.append(filename)
+            except Exception as e:
+                logger.exception("Compaction of %s failed: %s", filename, e)
+        return compacted
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                await ingestion_executor.run(self.compact)
+            except ExecutorSaturated:
+                logger.info("Ingestion queue is full, compaction postponed")
+            except Exception as e:
+                logger.exception("Compaction run failed: %s", e)
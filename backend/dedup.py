@@ -0,0 +1,80 @@
+import hashlib
+import re
+
+# Near-duplicate detection with 64-bit SimHash signatures.
+# PDF boilerplate (headers, footers, disclaimers, TOC pages) produces chunks that differ
+# only by a page number or a few characters. Two chunks whose signatures differ in at most
+# SIMHASH_THRESHOLD bits are treated as the same chunk and stored once.
+
+SIMHASH_BITS = 64
+SIMHASH_THRESHOLD = 3
+SHINGLE_SIZE = 1  # word unigrams: a changed page number touches one feature, not a run of shingles
+# with 4 bands of 16 bits, any two signatures within 3 bits share at least one full band
+NUM_BANDS = SIMHASH_THRESHOLD + 1
+BAND_BITS = SIMHASH_BITS // NUM_BANDS
+
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> list:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text: str) -> int:
+    weights = [0] * SIMHASH_BITS
+    for shingle in _shingles(text):
+        # blake2b instead of hash(): signatures are persisted, hash() is salted per process
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    signature = 0
+    for bit in range(SIMHASH_BITS):
+        if weights[bit] > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    # banded lookup table, so finding a near duplicate does not compare against every signature
+
+    def __init__(self, threshold: int = SIMHASH_THRESHOLD):
+        self.threshold = threshold
+        self.bands = [{} for _ in range(NUM_BANDS)]
+
+    def _band_keys(self, signature: int):
+        mask = (1 << BAND_BITS) - 1
+        for band in range(NUM_BANDS):
+            yield band, (signature >> (band * BAND_BITS)) & mask
+
+    def add(self, signature: int, value):
+        for band, key in self._band_keys(signature):
+            self.bands[band].setdefault(key, []).append((signature, value))
+
+    def find(self, signature: int):
+        for band, key in self._band_keys(signature):
+            for candidate, value in self.bands[band].get(key, ()):
+                if hamming_distance(signature, candidate) <= self.threshold:
+                    return value
+        return None
+
+
+def find_near_duplicates(chunks: list, threshold: int = SIMHASH_THRESHOLD):
+    # returns (signatures, canonical) where canonical[i] is the position of the first chunk
+    # chunk i duplicates, or i itself if it is the first of its kind
+    signatures = [simhash(chunk) for chunk in chunks]
+    lookup = SimHashIndex(threshold)
+    canonical = []
+    for position, signature in enumerate(signatures):
+        match = lookup.find(signature)
+        if match is None:
+            lookup.add(signature, position)
+            canonical.append(position)
+        else:
+            canonical.append(match)
+    return signatures, canonical
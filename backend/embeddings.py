@@ -1,170 +1,787 @@
-from sentence_transformers import SentenceTransformer, util
-import faiss
-import numpy as np
-import os
-import re
-import pickle
-from pdf_processing import process_uploaded_pdfs
-from models import model
-from llm import guess_document_type, split_text, split_text_by_sections
-
-# MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
-# MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-INDEX_DIR = "data/embeddings"
-os.makedirs(INDEX_DIR, exist_ok=True)
-# INDEX_PATH = "data/embeddings/index.faiss"
-# METADATA_PATH = "data/embeddings/metadata.pkl"
-
-# FAISS is Approximate Nearest Neighbor (ANN) search library. 벡터 중 쿼리와 유사한 벡터값 찾기.근사값기준으로 top_k 청크 추출.
-# It is vector search library, it is fast. but not the most accurate.
-# semantic re-ranking is needed for better accuracy. FAISS가 가져온 top_k 청크를 다시 정렬하는 것.query_embedding과 각각의 chunk_embedding 사이의 cosine similarity 재계산.가장 의미적으로 가까운 순서로 정렬 
-# cosine similarity is used for semantic search.
-# FAISS supports inner product and L2 distance.
-# To use cosine similarity with FAISS, normalize all vectors and use inner product.
-
-# total docs contents (vector embedding)
-# numerous embedded vectors (FAISS)
-# Top 30 chunks (semantic search) -> re-ranking (cosine similarity)
-# -> top 8 chunks (final answer)
-# -> generate final answer (LLM)
-
-
-
-# now changing the indexing for individual pdf files. individual FAISS and pkl
-
-
-def create_index():
-    # return faiss.IndexFlatL2(768) # 768 is the dimension of the embeddings from the model
-    return faiss.IndexFlatIP(model.get_sentence_embedding_dimension())  # Using inner product for cosine similarity search
-
-def save_individual_index(pdf_filename, index, metadata):
-    base_filename = pdf_filename.replace('.pdf', '')
-    index_path = os.path.join(INDEX_DIR, f"{base_filename}.faiss")
-    meta_path = os.path.join(INDEX_DIR, f"{base_filename}.pkl")
-    
-    os.makedirs(os.path.dirname(index_path), exist_ok=True)
-    faiss.write_index(index, index_path)
-    with open(meta_path, "wb") as f:
-        pickle.dump(metadata, f)
-
-def load_individual_index(pdf_filename):
-    base_filename = pdf_filename.replace('.pdf', '')
-    index_path = os.path.join(INDEX_DIR, f"{base_filename}.faiss")
-    meta_path = os.path.join(INDEX_DIR, f"{base_filename}.pkl")
-    if not os.path.exists(index_path) or not os.path.exists(meta_path):
-        print(f"Index or metadata for {pdf_filename} not found. Creating new index.")
-        return create_index(), []
-    try:
-        index = faiss.read_index(index_path)
-        with open(meta_path, "rb") as f:
-            metadata = pickle.load(f)
-
-    except Exception as e:
-        print(f"Error loading index or metadata for {pdf_filename}: {e}. Returing new index.")
-        return create_index(), []
-    
-    return index, metadata
-
-
-def embed_and_store_individual(text_data):
-    if not isinstance(text_data, list) or not text_data:
-        print(f"Error: Invalid data format, got {type(text_data)}")
-        return
-
-    for item in text_data:
-        if not isinstance(item, dict) or "text" not in item or "filename" not in item:
-            print(f"Warning: Skipping invalid item in embed_and_store_individual: {item}")
-            continue
-
-        pdf_filename = item["filename"]
-        text = item["text"]
-
-        index, metadata = create_index(), []
-
-        if not text.strip():
-            print(f"Warning: Empty text for {pdf_filename}. Skipping.")
-            save_individual_index(pdf_filename, index, metadata)
-            continue
-        
-        doc_type = guess_document_type(text)
-        # has_sections = bool(re.search(r'\b\d+(\.\d+)*\s+[^\n]+', text))
-        # if doc_type == "academic" and has_sections:
-        if doc_type == "academic" and bool(re.search(r'\b\d+(\.\d+)*\s+[A-Z]', text)): 
-            chunks = split_text_by_sections(text)
-        else:
-            chunks = split_text(text)
-        # chunks = split_text_by_sections(text) if doc_type == "academic" else split_text(text)
-        if not chunks:
-            print(f"No valid chunks found for {item['filename']} after splitting. Skipping.")
-            save_individual_index(pdf_filename, index, metadata)
-            continue    
-
-        embeddings = model.encode(chunks)
-
-        if embeddings.ndim == 1: # only one chunk, expand dimensions to 2D
-            embeddings = np.expand_dims(embeddings, axis=0)
-        if embeddings.size > 0:
-            faiss.normalize_L2(embeddings)
-            index.add(np.array(embeddings))
-            current_file_metadata = [{"filename": pdf_filename, "chunk": chunk, "doc_type": doc_type} for chunk in chunks]
-            metadata.extend(current_file_metadata)
-
-        else:
-            print(f"No embeddings generated for {pdf_filename}. Skipping.")
-        
-        save_individual_index(item["filename"], index, metadata)
-        print(f"Stored embeddings for {pdf_filename} with {len(metadata)} chunks.")
-
-def search_unified(query:str, filenames:list, top_k:int=50) -> list:
-    if not query.strip() or not filenames:
-        print("Error: Empty query or filenames list.")
-        return []
-    
-    query_vec = model.encode([query])
-
-    faiss.normalize_L2(query_vec)  # Normalize the query vector for cosine similarity
-
-    combined_chunks_with_scores = []
-
-    for filename in filenames:
-        index, metadata = load_individual_index(filename)
-        
-        if index.ntotal == 0 or not metadata:
-            print(f"No embeddings found for {filename}. Skipping.")
-            continue
-
-        distances, indices = index.search(query_vec, min(top_k, index.ntotal))
-        
-        for i in range(len(indices[0])):
-            idx = indices[0][i]
-            score = distances[0][i]
-            if idx < len(metadata):
-                combined_chunks_with_scores.append({"score": score, "data": metadata[idx]})
-            else:
-                print(f"Warning: Index {idx} out of bounds for metadata length {len(metadata)} in {filename}.")
-    
-    combined_chunks_with_scores.sort(key=lambda x: x["score"], reverse=True)
-
-    final_top_k_chunks = [item["data"] for item in combined_chunks_with_scores[:top_k]]
-
-    return final_top_k_chunks
-
-def store_embedding_for_pdf(pdf_path: str):
-
-    pdf_dir = os.path.dirname(pdf_path)
-
-    filename = os.path.basename(pdf_path)
-    text = ""
-    try:
-        from pdf_processing import extract_text_from_pdf
-        text = extract_text_from_pdf(pdf_path)
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return
-    if text:
-        text_data = [{"filename": filename, "text": text}]
-        embed_and_store_individual(text_data)
-    else:
-        print(f"No text extracted from {pdf_path}. Skipping embedding.")
-
-
+from sentence_transformers import SentenceTransformer, util
+import faiss
+import numpy as np
+import os
+import math
+import hashlib
+import json
+import pickle
+import tempfile
+import threading
+from functools import lru_cache
+from collections import defaultdict, Counter
+from pdf_processing import process_uploaded_pdfs
+from models import model, MODEL_NAME
+from llm import stop_words
+from chunking import chunk_document, chunk_text_from_span, CHUNK_MAX_LEN, CHUNK_MIN_LEN
+from bm25 import tokenize, build_bm25_index, bm25_search, reciprocal_rank_fusion, is_keyword_query
+from dedup import find_near_duplicates, SimHashIndex, SIMHASH_BITS, SIMHASH_THRESHOLD, SHINGLE_SIZE
+from observability import logger, timed, stage, record_cache
+
+# MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+# MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+INDEX_DIR = "data/embeddings"
+os.makedirs(INDEX_DIR, exist_ok=True)
+# INDEX_PATH = "data/embeddings/index.faiss"
+# METADATA_PATH = "data/embeddings/metadata.pkl"
+
+# "dense" (FAISS only), "lexical" (BM25 only) or "hybrid" (both, fused with reciprocal rank fusion)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+
+# with several files selected, each is first asked for its share of top_k (times
+# RETRIEVAL_OVERSAMPLE, at least RETRIEVAL_MIN_BUDGET) and asked for more only while its hits
+# could still make the overall top_k; see plan_candidates
+RETRIEVAL_OVERSAMPLE = float(os.getenv("RETRIEVAL_OVERSAMPLE", "2"))
+RETRIEVAL_MIN_BUDGET = int(os.getenv("RETRIEVAL_MIN_BUDGET", "8"))
+# candidates every selected file gets for summary and comparison queries, however it ranks
+RETRIEVAL_PER_FILE_MIN = int(os.getenv("RETRIEVAL_PER_FILE_MIN", "10"))
+# dense hits below this cosine similarity are dropped and end a file's search early; unset: off
+RETRIEVAL_MIN_SCORE = float(os.environ["RETRIEVAL_MIN_SCORE"]) if os.getenv("RETRIEVAL_MIN_SCORE") else None
+
+# near-duplicate chunks are always collapsed within a document. Across the corpus it is opt-in:
+# a chunk already stored by another document is kept only as a reference to that document's row.
+DEDUP_ACROSS_CORPUS = os.getenv("DEDUP_ACROSS_CORPUS", "false").lower() in ("1", "true", "yes")
+CORPUS_SIGNATURES_PATH = os.path.join(INDEX_DIR, "corpus_simhash.pkl")
+corpus_lock = threading.Lock()
+
+# with STORE_CHUNK_TEXT=false the .pkl keeps only page/span per chunk, and chunk text is
+# hydrated on demand from the extracted text cached next to the index (<name>.txt)
+STORE_CHUNK_TEXT = os.getenv("STORE_CHUNK_TEXT", "false").lower() in ("1", "true", "yes")
+
+# what the stored vectors and chunks were made with; see check_index_info and snapshots.py
+INDEX_INFO_PATH = os.path.join(INDEX_DIR, "index_info.json")
+
+# index files are written to a temp file and os.replace'd, so readers never see a half-written
+# file; index_lock keeps the files of one document consistent with each other (snapshot export)
+index_lock = threading.RLock()
+
+# held while a document is re-indexed, deleted or compacted, so those never interleave
+document_locks = defaultdict(threading.Lock)
+document_locks_guard = threading.Lock()
+
+# FAISS is Approximate Nearest Neighbor (ANN) search library. 벡터 중 쿼리와 유사한 벡터값 찾기.근사값기준으로 top_k 청크 추출.
+# It is vector search library, it is fast. but not the most accurate.
+# semantic re-ranking is needed for better accuracy. FAISS가 가져온 top_k 청크를 다시 정렬하는 것.query_embedding과 각각의 chunk_embedding 사이의 cosine similarity 재계산.가장 의미적으로 가까운 순서로 정렬 
+# cosine similarity is used for semantic search.
+# FAISS supports inner product and L2 distance.
+# To use cosine similarity with FAISS, normalize all vectors and use inner product.
+
+# total docs contents (vector embedding)
+# numerous embedded vectors (FAISS)
+# Top 30 chunks (semantic search) -> re-ranking (cosine similarity)
+# -> top 8 chunks (final answer)
+# -> generate final answer (LLM)
+
+
+
+# now changing the indexing for individual pdf files. individual FAISS and pkl
+
+
+def create_index():
+    # return faiss.IndexFlatL2(768) # 768 is the dimension of the embeddings from the model
+    return faiss.IndexFlatIP(model.get_sentence_embedding_dimension())  # Using inner product for cosine similarity search
+
+def replace_file(path, write):
+    # a temp file of its own per write, so concurrent writers of one file never share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+def write_pickle(path, obj):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            pickle.dump(obj, f)
+    replace_file(path, write)
+
+def index_info():
+    return {
+        "model": MODEL_NAME,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "chunking": {"max_len": CHUNK_MAX_LEN, "min_len": CHUNK_MIN_LEN},
+        "dedup": {"simhash_bits": SIMHASH_BITS, "threshold": SIMHASH_THRESHOLD, "shingle_size": SHINGLE_SIZE},
+        "store_chunk_text": STORE_CHUNK_TEXT,
+    }
+
+def load_index_info():
+    if not os.path.exists(INDEX_INFO_PATH):
+        return None
+    with open(INDEX_INFO_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def check_index_info(info=None):
+    # vectors from another embedding model are meaningless to this one: refuse them instead of serving them
+    info = info or load_index_info()
+    if info is None:
+        return
+    current = index_info()
+    if info.get("model") != current["model"] or info.get("dimension") != current["dimension"]:
+        raise ValueError(f"Index was built with {info.get('model')} ({info.get('dimension')} dims), "
+                         f"this node runs {current['model']} ({current['dimension']} dims)")
+    if info.get("chunking") != current["chunking"] or info.get("dedup") != current["dedup"]:
+        print(f"Warning: Index was chunked with {info.get('chunking')} / {info.get('dedup')}, new uploads use {current['chunking']} / {current['dedup']}.")
+
+def ensure_index_info():
+    if os.path.exists(INDEX_INFO_PATH):
+        return
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index_info(), f, indent=2)
+    replace_file(INDEX_INFO_PATH, write)
+
+def document_lock(pdf_filename):
+    with document_locks_guard:
+        return document_locks[pdf_filename]
+
+def save_document_and_index(pdf_filename, text, index, metadata, refs=None):
+    with index_lock:
+        save_document_text(pdf_filename, text)
+        save_individual_index(pdf_filename, index, metadata, refs)
+        ensure_index_info()
+        if is_deleted(pdf_filename):
+            os.remove(tombstone_path(pdf_filename))  # uploaded again before compaction removed it
+
+def save_individual_index(pdf_filename, index, metadata, refs=None):
+    base_filename = pdf_filename.replace('.pdf', '')
+    index_path = os.path.join(INDEX_DIR, f"{base_filename}.faiss")
+    meta_path = os.path.join(INDEX_DIR, f"{base_filename}.pkl")
+    refs_path = os.path.join(INDEX_DIR, f"{base_filename}.refs.pkl")
+    
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    with index_lock:
+        replace_file(index_path, lambda tmp_path: faiss.write_index(index, tmp_path))
+        write_pickle(meta_path, metadata)
+        if refs:
+            write_pickle(refs_path, refs)
+        elif os.path.exists(refs_path):
+            os.remove(refs_path)
+        save_bm25_index(pdf_filename, build_bm25_index(bm25_texts(pdf_filename, metadata, refs or [])))
+
+def bm25_texts(pdf_filename, metadata, refs):
+    # tombstoned rows get no terms, so they never match lexically. Chunks borrowed through corpus
+    # refs follow the document's own rows, with their text from this document's span.
+    texts = ["" if item.get("deleted") else item["chunk"] for item in hydrate_chunks(metadata)]
+    return texts + [item["chunk"] for item in hydrate_chunks([dict(ref, filename=pdf_filename) for ref in refs])]
+
+def save_bm25_index(pdf_filename, bm25_index):
+    base_filename = pdf_filename.replace('.pdf', '')
+    bm25_path = os.path.join(INDEX_DIR, f"{base_filename}.bm25.pkl")
+    write_pickle(bm25_path, bm25_index)
+
+def load_bm25_index(pdf_filename, metadata=None, n_refs=0):
+    base_filename = pdf_filename.replace('.pdf', '')
+    bm25_path = os.path.join(INDEX_DIR, f"{base_filename}.bm25.pkl")
+    stamp = file_stamp(bm25_path)
+    if stamp is not None:
+        try:
+            with open(bm25_path, "rb") as f:
+                bm25_index = pickle.load(f)
+            # stored before borrowed chunks were indexed too: rebuilt below
+            if metadata is None or bm25_index["n_docs"] == len(metadata) + n_refs:
+                return bm25_index
+        except Exception as e:
+            print(f"Error loading BM25 index for {pdf_filename}: {e}. Rebuilding.")
+    if not metadata and not n_refs:
+        return None
+    # indexes stored before the lexical index existed: build it once from the stored chunks
+    bm25_index = build_bm25_index(bm25_texts(pdf_filename, metadata or [], load_document_refs(pdf_filename)))
+    with index_lock:
+        # every metadata write saves a fresh BM25 index too (save_individual_index): if the file
+        # changed meanwhile, this rebuild is from stale metadata and must not overwrite it
+        if file_stamp(bm25_path) == stamp:
+            save_bm25_index(pdf_filename, bm25_index)
+    return bm25_index
+
+def save_document_text(pdf_filename, text):
+    base_filename = pdf_filename.replace('.pdf', '')
+    text_path = os.path.join(INDEX_DIR, f"{base_filename}.txt")
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    replace_file(text_path, write)
+
+@lru_cache(maxsize=32)
+def _read_document_text(text_path, mtime_ns):
+    with open(text_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def load_document_text(pdf_filename):
+    base_filename = pdf_filename.replace('.pdf', '')
+    text_path = os.path.join(INDEX_DIR, f"{base_filename}.txt")
+    try:
+        # mtime in the cache key: a re-ingested document is never served from a stale cache
+        hits = _read_document_text.cache_info().hits
+        text = _read_document_text(text_path, os.stat(text_path).st_mtime_ns)
+        record_cache("document_text", _read_document_text.cache_info().hits > hits)
+        return text
+    except OSError:
+        return None
+
+def hydrate_chunks(items):
+    # fills in "chunk" for span-only metadata; entries that already carry text are returned as is
+    hydrated = []
+    for item in items:
+        if "chunk" in item:
+            hydrated.append(item)
+            continue
+        text = load_document_text(item["filename"])
+        if text is None:
+            print(f"Warning: Extracted text for {item['filename']} not found, cannot hydrate chunk.")
+            hydrated.append(dict(item, chunk=""))
+            continue
+        hydrated.append(dict(item, chunk=chunk_text_from_span(text, item["start"], item["end"])))
+    return hydrated
+
+def make_citation(item):
+    # compact source reference for API responses; the text is fetched separately via /chunk/
+    citation = {key: item[key] for key in ("filename", "page", "start", "end", "doc_type", "chunk_index") if key in item}
+    if "start" not in item:
+        citation["chunk"] = item.get("chunk", "")  # stored before spans were recorded
+    if item.get("duplicate_of"):
+        citation["duplicate_of"] = item["duplicate_of"]
+    return citation
+
+def load_document_refs(pdf_filename):
+    base_filename = pdf_filename.replace('.pdf', '')
+    refs_path = os.path.join(INDEX_DIR, f"{base_filename}.refs.pkl")
+    if not os.path.exists(refs_path):
+        return []
+    try:
+        with open(refs_path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Error loading corpus references for {pdf_filename}: {e}")
+        return []
+
+def load_corpus_signatures():
+    if not os.path.exists(CORPUS_SIGNATURES_PATH):
+        return {}
+    try:
+        with open(CORPUS_SIGNATURES_PATH, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Error loading corpus signatures: {e}. Starting empty.")
+        return {}
+
+def save_corpus_signatures(signatures_by_file):
+    write_pickle(CORPUS_SIGNATURES_PATH, signatures_by_file)
+
+def dedup_against_corpus(pdf_filename, positions, signatures, duplicates_of, chunk_spans):
+    # returns the positions this document still has to store, and references for the rest
+    refs = []
+    kept = []
+    with corpus_lock:
+        signatures_by_file = load_corpus_signatures()
+        signatures_by_file.pop(pdf_filename, None)  # re-upload: don't match against our own old version
+
+        lookup = SimHashIndex()
+        for other_filename, other_signatures in signatures_by_file.items():
+            for signature in other_signatures:
+                lookup.add(signature, (other_filename, signature))
+
+        for position in positions:
+            match = lookup.find(signatures[position])
+            if match is None:
+                kept.append(position)
+            else:
+                other_filename, other_signature = match
+                refs.append({
+                    "filename": other_filename,
+                    "simhash": other_signature,
+                    **chunk_provenance(chunk_spans[position], position),  # where it sits in this document
+                    "duplicates": duplicates_of.get(position, []),
+                })
+
+        signatures_by_file[pdf_filename] = [signatures[position] for position in kept]
+        save_corpus_signatures(signatures_by_file)
+    return kept, refs
+
+@timed("index_load")
+def load_individual_index(pdf_filename):
+    base_filename = pdf_filename.replace('.pdf', '')
+    index_path = os.path.join(INDEX_DIR, f"{base_filename}.faiss")
+    meta_path = os.path.join(INDEX_DIR, f"{base_filename}.pkl")
+    if not os.path.exists(index_path) or not os.path.exists(meta_path):
+        print(f"Index or metadata for {pdf_filename} not found. Creating new index.")
+        return create_index(), []
+    try:
+        # files are swapped by os.replace (re-upload, compaction): retry if the pair changed mid-read
+        for attempt in range(3):
+            files_before = (os.stat(index_path).st_ino, os.stat(meta_path).st_ino)
+            index = faiss.read_index(index_path)
+            with open(meta_path, "rb") as f:
+                metadata = pickle.load(f)
+            if (os.stat(index_path).st_ino, os.stat(meta_path).st_ino) == files_before:
+                break
+
+    except Exception as e:
+        print(f"Error loading index or metadata for {pdf_filename}: {e}. Returing new index.")
+        return create_index(), []
+    
+    return index, metadata
+
+
+def embed_and_store_individual(text_data):
+    if not isinstance(text_data, list) or not text_data:
+        print(f"Error: Invalid data format, got {type(text_data)}")
+        return []
+
+    stats = []
+    for item in text_data:
+        if not isinstance(item, dict) or "text" not in item or "filename" not in item:
+            print(f"Warning: Skipping invalid item in embed_and_store_individual: {item}")
+            continue
+
+        with document_lock(item["filename"]):
+            stats.append(embed_and_store_document(item["filename"], item["text"], item.get("page_starts")))
+    return stats
+
+def embed_and_store_document(pdf_filename, text, page_starts=None):
+    # (re)indexes one document. Chunks whose text is unchanged since the stored version keep
+    # their vectors instead of being re-encoded; stored rows that disappear but are still
+    # referenced by other documents stay behind as tombstoned rows (see compaction.py).
+    stats = {"filename": pdf_filename, "chunks": 0, "reused": 0, "embedded": 0, "tombstoned": 0}
+    old_index, old_rows = create_index(), []
+    if os.path.exists(os.path.join(INDEX_DIR, f"{pdf_filename.replace('.pdf', '')}.faiss")):
+        old_index, old_metadata = load_individual_index(pdf_filename)
+        old_rows = hydrate_chunks(old_metadata)  # the stored version's text, read before it is overwritten
+    reusable = {item["chunk"]: row for row, item in enumerate(old_rows) if not item.get("deleted") and row < old_index.ntotal}
+
+    index, metadata = create_index(), []
+    refs = []
+
+    if not text.strip():
+        print(f"Warning: Empty text for {pdf_filename}. Skipping.")
+        chunk_spans = []
+    else:
+        # academic documents with numbered sections are split per section
+        doc_type, chunk_spans = chunk_document(text, page_starts=page_starts)
+        if not chunk_spans:
+            print(f"No valid chunks found for {pdf_filename} after splitting. Skipping.")
+
+    chunks = [span["chunk"] for span in chunk_spans]
+    positions = []
+    if chunks:
+        signatures, canonical = find_near_duplicates(chunks)
+        duplicates_of = defaultdict(list)
+        for position, first in enumerate(canonical):
+            if first != position:
+                duplicates_of[first].append(chunk_provenance(chunk_spans[position], position))
+        positions = [position for position, first in enumerate(canonical) if first == position]
+
+        if DEDUP_ACROSS_CORPUS:
+            positions, refs = dedup_against_corpus(pdf_filename, positions, signatures, duplicates_of, chunk_spans)
+
+        if len(positions) < len(chunks):
+            logger.info("Collapsed %d near-duplicate chunks for %s (%d stored by other documents)", len(chunks) - len(positions), pdf_filename, len(refs))
+
+    if positions:
+        vectors = {position: old_index.reconstruct(reusable[chunks[position]]) for position in positions if chunks[position] in reusable}
+        to_encode = [position for position in positions if position not in vectors]
+        if to_encode:
+            with stage("embedding"):
+                embeddings = model.encode([chunks[position] for position in to_encode])
+            if embeddings.ndim == 1: # only one chunk, expand dimensions to 2D
+                embeddings = np.expand_dims(embeddings, axis=0)
+            faiss.normalize_L2(embeddings)
+            vectors.update(zip(to_encode, embeddings))
+
+        index.add(np.array([vectors[position] for position in positions], dtype="float32"))
+        for position in positions:
+            entry = {
+                "filename": pdf_filename,
+                "doc_type": doc_type,
+                **chunk_provenance(chunk_spans[position], position),
+                "simhash": signatures[position],
+                "duplicates": duplicates_of.get(position, []),  # where the collapsed copies were
+            }
+            if STORE_CHUNK_TEXT:
+                entry["chunk"] = chunks[position]
+            metadata.append(entry)
+        stats.update(chunks=len(positions), reused=len(positions) - len(to_encode), embedded=len(to_encode))
+
+    stats["tombstoned"] = keep_referenced_rows(pdf_filename, index, metadata, old_index, old_rows)
+    save_document_and_index(pdf_filename, text, index, metadata, refs)
+    print(f"Stored embeddings for {pdf_filename} with {len(metadata)} chunks ({stats['reused']} reused, {stats['embedded']} embedded).")
+    return stats
+
+def keep_referenced_rows(pdf_filename, index, metadata, old_index, old_rows):
+    # rows of the previous version that other documents point at (corpus refs) can't just vanish:
+    # they are kept as tombstoned rows, text inline, until compaction moves them to the referrers
+    referenced = {ref["simhash"] for referrer, refs in document_refs_by_referrer().items()
+                  if referrer != pdf_filename for ref in refs if ref["filename"] == pdf_filename}
+    live = {item["simhash"] for item in metadata}
+    kept = 0
+    for row, item in enumerate(old_rows):
+        if item.get("simhash") in referenced and item["simhash"] not in live and row < old_index.ntotal:
+            index.add(np.expand_dims(old_index.reconstruct(row), axis=0))
+            metadata.append(dict(item, deleted=True))
+            live.add(item["simhash"])
+            kept += 1
+    return kept
+
+def document_refs_by_referrer():
+    # {filename: corpus refs} for every live document that borrows chunks from others
+    refs_by_referrer = {}
+    if not os.path.isdir(INDEX_DIR):
+        return refs_by_referrer
+    for name in os.listdir(INDEX_DIR):
+        if name.endswith(".refs.pkl"):
+            filename = f"{name[:-len('.refs.pkl')]}.pdf"
+            if not is_deleted(filename):
+                refs_by_referrer[filename] = load_document_refs(filename)
+    return refs_by_referrer
+
+def tombstone_path(pdf_filename):
+    return os.path.join(INDEX_DIR, f"{pdf_filename.replace('.pdf', '')}.tombstone")
+
+def is_deleted(pdf_filename):
+    return os.path.exists(tombstone_path(pdf_filename))
+
+def index_version(filenames):
+    # changes whenever one of the documents is indexed, re-indexed, deleted or compacted: every
+    # write replaces its .pkl, so the mtimes are enough and nothing has to be read
+    parts = []
+    for filename in sorted(set(filenames)):
+        for path in (os.path.join(INDEX_DIR, f"{filename.replace('.pdf', '')}.pkl"), tombstone_path(filename)):
+            try:
+                parts.append(f"{path}:{os.stat(path).st_mtime_ns}")
+            except OSError:
+                parts.append(f"{path}:-")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def delete_document(pdf_filename):
+    # marks the document deleted: it disappears from search right away, its files are removed
+    # by compaction once no other document borrows rows from it. Returns False if not indexed.
+    with document_lock(pdf_filename):
+        if not os.path.exists(os.path.join(INDEX_DIR, f"{pdf_filename.replace('.pdf', '')}.faiss")) or is_deleted(pdf_filename):
+            return False
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(pdf_filename)
+        replace_file(tombstone_path(pdf_filename), write)
+        with corpus_lock:
+            signatures_by_file = load_corpus_signatures()
+            if signatures_by_file.pop(pdf_filename, None) is not None:
+                save_corpus_signatures(signatures_by_file)
+    logger.info("Marked %s as deleted", pdf_filename)
+    return True
+
+def chunk_provenance(span, position):
+    provenance = {"chunk_index": position, "start": span["start"], "end": span["end"]}
+    if "page" in span:
+        provenance["page"] = span["page"]
+    return provenance
+
+def search_unified(query:str, filenames:list, top_k:int=50, mode:str=None) -> list:
+    if not query.strip() or not filenames:
+        print("Error: Empty query or filenames list.")
+        return []
+
+    return search_unified_batch([query], filenames, top_k=top_k, mode=mode)[0]
+
+def load_searchable_indexes(filenames):
+    loaded = []
+    for filename in filenames:
+        if is_deleted(filename):
+            print(f"{filename} was deleted. Skipping.")
+            continue
+        index, metadata = load_individual_index(filename)
+        
+        if (index.ntotal == 0 or not metadata) and not load_document_refs(filename):
+            print(f"No embeddings found for {filename}. Skipping.")
+            continue
+        loaded.append((filename, index, metadata))
+    return loaded
+
+def resolve_search_mode(mode):
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        print(f"Warning: Unknown search mode '{mode}', using dense search.")
+        mode = "dense"
+    return mode
+
+def encode_queries(queries):
+    query_vecs = model.encode(queries)
+    if query_vecs.ndim == 1:
+        query_vecs = np.expand_dims(query_vecs, axis=0)
+    faiss.normalize_L2(query_vecs)  # Normalize the query vectors for cosine similarity
+    return query_vecs
+
+def per_file_budget(top_k, n_files, per_file_min=0):
+    # hits each file is asked for first
+    budget = math.ceil(top_k * RETRIEVAL_OVERSAMPLE / max(n_files, 1))
+    return max(min(top_k, max(budget, RETRIEVAL_MIN_BUDGET)), per_file_min)
+
+def keep_per_file_minimum(ranking, top_k, per_file_min, file_of):
+    # the first top_k entries, then further ones for files that have fewer than per_file_min
+    kept = ranking[:top_k]
+    if per_file_min:
+        counts = Counter(file_of(entry) for entry in kept)
+        for entry in ranking[top_k:]:
+            if counts[file_of(entry)] < per_file_min:
+                kept.append(entry)
+                counts[file_of(entry)] += 1
+    return kept
+
+def plan_candidates(searches, n_queries, top_k, per_file_min=0, min_score=None):
+    # per query: [(score, filename, row)] best first, the top_k over all files plus what keeps
+    # every file at per_file_min. searches: [(filename, capacity, search)], where search(k)
+    # returns the file's best k hits per query as [(score, row)]. A file is asked again, for
+    # twice as many, only while its last hit could still make some query's top_k, so the top_k
+    # is the same as asking every file for top_k hits, from far fewer candidates.
+    budget = per_file_budget(top_k, len(searches), per_file_min)
+    asked = {}
+    hits = {}
+    pending = searches
+    while pending:
+        for filename, capacity, search in pending:
+            asked[filename] = min(asked[filename] * 2 if filename in asked else budget, capacity, max(top_k, budget))
+            hits[filename] = search(asked[filename])
+
+        rankings = []
+        for position in range(n_queries):
+            ranking = [(score, filename, row) for filename in hits for score, row in hits[filename][position]
+                       if min_score is None or score >= min_score]
+            ranking.sort(key=lambda x: x[0], reverse=True)
+            rankings.append(ranking)
+
+        pending = []
+        for filename, capacity, search in searches:
+            if asked[filename] >= min(capacity, top_k):
+                continue
+            for position, ranking in enumerate(rankings):
+                file_hits = hits[filename][position]
+                if len(file_hits) < asked[filename]:
+                    continue  # the file has no more hits for this query
+                last_score = file_hits[-1][0]
+                if min_score is not None and last_score < min_score:
+                    continue  # everything further down is below the threshold too
+                if len(ranking) < top_k or last_score >= ranking[top_k - 1][0]:
+                    pending.append((filename, capacity, search))
+                    break
+    return [keep_per_file_minimum(ranking, top_k, per_file_min, lambda entry: entry[1]) for ranking in rankings]
+
+def wants_query_vector(query, mode):
+    # whether a search is likely to need the query's embedding (hybrid keyword queries fall back
+    # to it only when BM25 finds nothing, see needs_dense)
+    return bool(query.strip()) and mode != "lexical" and not (mode == "hybrid" and is_keyword_query(query, stop_words))
+
+def query_vectors(queries, positions, vectors=None):
+    # vectors the caller already encoded are reused, the missing ones are encoded in one batch
+    vectors = list(vectors) if vectors is not None else [None] * len(queries)
+    missing = [position for position in positions if vectors[position] is None]
+    if missing:
+        for position, vector in zip(missing, encode_queries([queries[position] for position in missing])):
+            vectors[position] = vector
+    return np.array([vectors[position] for position in positions], dtype="float32")
+
+def lexical_rankings(queries, loaded, borrowed, top_k, per_file_min=0):
+    # per query: [(bm25 score, filename, row)] best first, across all loaded documents
+    rankings = [[] for _ in queries]
+    bm25_by_file = {}
+    for position, query in enumerate(queries):
+        if not query.strip():
+            continue
+        query_terms = tokenize(query)
+        searches = []
+        for filename, _, metadata in loaded:
+            refs = borrowed[filename]
+            if filename not in bm25_by_file:
+                bm25_by_file[filename] = load_bm25_index(filename, metadata, len(refs))
+            # BM25 rows past the metadata are borrowed chunks; skipped where they aren't searched here
+            skipped = sum(1 for ref in refs if ref is None)
+            def search(k, bm25_index=bm25_by_file[filename], metadata=metadata, refs=refs, skipped=skipped):
+                hits = [(score, idx) for idx, score in bm25_search(bm25_index, query_terms, k + skipped)
+                        if idx < len(metadata) or (idx - len(metadata) < len(refs) and refs[idx - len(metadata)] is not None)]
+                return [hits[:k]]
+            searches.append((filename, len(metadata) + len(refs) - skipped, search))
+        rankings[position] = plan_candidates(searches, 1, top_k, per_file_min)[0]
+    return rankings
+
+def dense_search(filename, index, metadata, query_vecs):
+    # search(k) for plan_candidates: the best k live rows per query vector
+    # tombstoned rows are still in the FAISS index until compaction: search past them
+    dead = sum(1 for item in metadata if item.get("deleted"))
+    def search(k):
+        distances, indices = index.search(query_vecs, min(k + dead, index.ntotal))
+        found = []
+        for row in range(len(query_vecs)):
+            hits = []
+            for score, idx in zip(distances[row], indices[row]):
+                if idx < 0:
+                    continue
+                if idx < len(metadata):
+                    if not metadata[idx].get("deleted"):
+                        hits.append((score, int(idx)))
+                else:
+                    print(f"Warning: Index {idx} out of bounds for metadata length {len(metadata)} in {filename}.")
+            found.append(hits[:k])
+        return found
+    return search, index.ntotal - dead
+
+def dense_rankings(query_vecs, loaded, borrowed, top_k, per_file_min=0):
+    # per query vector: [(cosine score, filename, row)] best first
+    searches = []
+    for filename, index, metadata in loaded:
+        if index.ntotal == 0:
+            continue
+        search, capacity = dense_search(filename, index, metadata, query_vecs)
+        searches.append((filename, capacity, search))
+    rankings = plan_candidates(searches, len(query_vecs), top_k, per_file_min, RETRIEVAL_MIN_SCORE)
+
+    # borrowed chunks live in their owners' indexes: their vectors are scored directly
+    for filename, _, metadata in loaded:
+        for offset, ref in enumerate(borrowed[filename]):
+            if ref is None:
+                continue
+            scores = query_vecs @ ref[0]  # one score per query
+            for row in range(len(query_vecs)):
+                rankings[row].append((scores[row], filename, len(metadata) + offset))
+
+    return [keep_per_file_minimum(sorted(ranking, key=lambda x: x[0], reverse=True), top_k, per_file_min, lambda entry: entry[1])
+            for ranking in rankings]
+
+def fuse_rankings(dense_ranking, lexical_ranking, mode, top_k, per_file_min=0):
+    # the (filename, row) keys of the final result, best first
+    if mode == "lexical" or not dense_ranking:
+        return [(filename, idx) for _, filename, idx in lexical_ranking]
+    if mode == "dense" or not lexical_ranking:
+        return [(filename, idx) for _, filename, idx in dense_ranking]
+
+    # rank fusion: dense cosine scores and BM25 scores live on different scales, ranks don't
+    fused = reciprocal_rank_fusion([
+        [(filename, idx) for _, filename, idx in dense_ranking],
+        [(filename, idx) for _, filename, idx in lexical_ranking],
+    ])
+    return keep_per_file_minimum([key for key, _ in fused], top_k, per_file_min, lambda key: key[0])
+
+def needs_dense(query, mode, lexical_ranking):
+    if not query.strip() or mode == "lexical":
+        return False
+    # identifiers, clause numbers, quoted phrases: the postings lookup is enough, skip the encoder
+    return not (mode == "hybrid" and lexical_ranking and is_keyword_query(query, stop_words))
+
+@timed("search")
+def search_unified_batch(queries:list, filenames:list, top_k:int=50, mode:str=None, per_file_min:int=0, vectors:list=None) -> list:
+    # one result list per query. Indexes are loaded once, all queries that need the dense
+    # side are encoded in a single model.encode call and searched as one matrix per index.
+    results = [[] for _ in queries]
+    if not filenames:
+        print("Error: Empty filenames list.")
+        return results
+
+    mode = resolve_search_mode(mode)
+    loaded = load_searchable_indexes(filenames)
+    borrowed, metadata_by_file = borrowed_chunks(loaded)
+
+    lexical = lexical_rankings(queries, loaded, borrowed, top_k, per_file_min) if mode in ("lexical", "hybrid") else [[] for _ in queries]
+    dense = [[] for _ in queries]
+    dense_positions = [position for position, query in enumerate(queries) if needs_dense(query, mode, lexical[position])]
+    if dense_positions:
+        query_vecs = query_vectors(queries, dense_positions, vectors)
+        for position, ranking in zip(dense_positions, dense_rankings(query_vecs, loaded, borrowed, top_k, per_file_min)):
+            dense[position] = ranking
+
+    for position in range(len(queries)):
+        keys = fuse_rankings(dense[position], lexical[position], mode, top_k, per_file_min)
+        results[position] = hydrate_chunks([metadata_by_file[filename][idx] for filename, idx in keys])
+    return results
+
+def search_shard(queries:list, vectors:list, filenames:list, top_k:int=50, mode:str=None, per_file_min:int=0) -> list:
+    # the shard side of sharding.search_sharded_batch: raw rankings over this node's documents,
+    # for query vectors encoded by the coordinator (None where the dense side isn't wanted).
+    # Items are hydrated here, where the document text lives; rankings refer to them by position.
+    mode = resolve_search_mode(mode)
+    loaded = load_searchable_indexes(filenames)
+    borrowed, metadata_by_file = borrowed_chunks(loaded)
+
+    lexical = lexical_rankings(queries, loaded, borrowed, top_k, per_file_min) if mode in ("lexical", "hybrid") else [[] for _ in queries]
+    dense = [[] for _ in queries]
+    dense_positions = [position for position, vector in enumerate(vectors) if vector is not None]
+    if dense_positions and loaded:
+        query_vecs = np.array([vectors[position] for position in dense_positions], dtype="float32")
+        for position, ranking in zip(dense_positions, dense_rankings(query_vecs, loaded, borrowed, top_k, per_file_min)):
+            dense[position] = ranking
+
+    results = []
+    for position in range(len(queries)):
+        keys = list(dict.fromkeys((filename, idx) for ranking in (dense[position], lexical[position]) for _, filename, idx in ranking))
+        slot = {key: i for i, key in enumerate(keys)}
+        results.append({
+            "items": hydrate_chunks([metadata_by_file[filename][idx] for filename, idx in keys]),
+            "dense": [(float(score), slot[(filename, idx)]) for score, filename, idx in dense[position]],
+            "lexical": [(float(score), slot[(filename, idx)]) for score, filename, idx in lexical[position]],
+        })
+    return results
+
+def resolve_corpus_refs(filename, selected_metadata):
+    # one slot per corpus ref of this document, in refs file order: (vector, entry) for a chunk
+    # searched through this document, None where it isn't. A selected document was searched
+    # already, except for its tombstoned rows: after a re-upload, borrowed chunks live there.
+    refs = load_document_refs(filename)
+    searched = {target: {item.get("simhash") for item in selected_metadata[target] if not item.get("deleted")}
+                for target in {ref["filename"] for ref in refs} if target in selected_metadata}
+    refs_by_target = defaultdict(list)
+    for position, ref in enumerate(refs):
+        if ref["simhash"] not in searched.get(ref["filename"], ()):
+            refs_by_target[ref["filename"]].append(position)
+
+    resolved = [None] * len(refs)
+    for target_filename, positions in refs_by_target.items():
+        index, metadata = load_individual_index(target_filename)
+        row_by_signature = {item.get("simhash"): row for row, item in enumerate(metadata)}
+        for position in positions:
+            ref = refs[position]
+            row = row_by_signature.get(ref["simhash"])
+            if row is None or row >= index.ntotal:
+                print(f"Warning: Reference from {filename} to {target_filename} no longer resolves.")
+                continue
+            # text from the owning document, provenance from this one
+            entry = dict(hydrate_chunks([metadata[row]])[0], duplicate_of=target_filename)
+            entry.pop("deleted", None)
+            entry.update({key: value for key, value in ref.items() if key != "simhash"}, filename=filename)
+            resolved[position] = (index.reconstruct(row), entry)
+    return resolved
+
+def borrowed_chunks(loaded):
+    # {filename: resolve_corpus_refs(...)} and {filename: rows}: a document's own metadata, then
+    # one row per corpus ref (None where unresolved), matching its BM25 rows (bm25_texts)
+    own_metadata = {filename: metadata for filename, _, metadata in loaded}
+    borrowed = {filename: resolve_corpus_refs(filename, own_metadata) for filename in own_metadata}
+    metadata_by_file = {filename: metadata + [None if ref is None else ref[1] for ref in borrowed[filename]]
+                        for filename, metadata in own_metadata.items()}
+    return borrowed, metadata_by_file
+
+def store_embedding_for_pdf(pdf_path: str):
+
+    pdf_dir = os.path.dirname(pdf_path)
+
+    filename = os.path.basename(pdf_path)
+    text = ""
+    try:
+        from pdf_processing import extract_text_with_pages
+        text, page_starts = extract_text_with_pages(pdf_path)
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return
+    if text:
+        text_data = [{"filename": filename, "text": text, "page_starts": page_starts}]
+        return embed_and_store_individual(text_data)[0]
+    else:
+        print(f"No text extracted from {pdf_path}. Skipping embedding.")
+
+
@@ -0,0 +1,93 @@
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from observability import Counter, QUEUE_DEPTH, STAGE_SECONDS, METRICS, current_trace
+
+# Dedicated, size-bounded thread pools for CPU-bound work, with admission control.
+#
+#   embedding: query classification and reranking (model forward passes on the query path)
+#   search:    index loading, BM25 / FAISS search, chunk text hydration
+#   ingestion: PDF extraction, chunking and encoding for uploads
+#
+# Each pool accepts at most workers + max_queue items; beyond that run() raises
+# ExecutorSaturated, which main.py turns into a 429/503 with Retry-After instead of letting
+# the backlog grow without bound. Keeping uploads in their own pool means a burst of slow
+# ingestions queues behind itself rather than in front of interactive queries.
+
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+EMBEDDING_MAX_QUEUE = int(os.getenv("EMBEDDING_MAX_QUEUE", "32"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+SEARCH_MAX_QUEUE = int(os.getenv("SEARCH_MAX_QUEUE", "64"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "1"))
+INGESTION_MAX_QUEUE = int(os.getenv("INGESTION_MAX_QUEUE", "8"))
+
+REJECTED_TASKS = Counter("docinsight_rejected_tasks_total", "Work items rejected because their executor queue was full")
+METRICS.append(REJECTED_TASKS)
+
+
+class ExecutorSaturated(Exception):
+    def __init__(self, name: str, status_code: int, retry_after: int):
+        super().__init__(f"{name} queue is full, retry in {retry_after}s")
+        self.name = name
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    # pending is only touched from the event loop thread, so it needs no lock
+    def __init__(self, name: str, workers: int, max_queue: int, status_code: int):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.status_code = status_code
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.pending = 0
+        self.avg_seconds = 1.0  # moving average of task run time, for Retry-After
+
+    def has_capacity(self, count: int = 1) -> bool:
+        return self.pending + count <= self.capacity
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.avg_seconds * self.pending / self.workers))
+
+    def check_capacity(self, count: int = 1):
+        if not self.has_capacity(count):
+            REJECTED_TASKS.inc(queue=self.name)
+            raise ExecutorSaturated(self.name, self.status_code, self.retry_after())
+
+    async def run(self, func, *args, **kwargs):
+        # like asyncio.to_thread (the request trace follows the call), but on this pool
+        self.check_capacity()
+        self.pending += 1
+        QUEUE_DEPTH.inc(queue=self.name)
+        submitted = time.perf_counter()
+        call = functools.partial(self._timed_call, submitted, func, *args, **kwargs)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, contextvars.copy_context().run, call)
+        finally:
+            self.pending -= 1
+            QUEUE_DEPTH.dec(queue=self.name)
+
+    def _timed_call(self, submitted, func, *args, **kwargs):
+        started = time.perf_counter()
+        waited = started - submitted
+        STAGE_SECONDS.observe(waited, stage=f"{self.name}_queue")
+        trace = current_trace.get()
+        if trace is not None:
+            trace["stages"].append((f"{self.name}_queue", waited))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.perf_counter() - started)
+
+
+# a full query pool means the server is overloaded (503); a full upload queue means the
+# client is sending documents faster than they can be ingested (429)
+embedding_executor = BoundedExecutor("embedding", EMBEDDING_WORKERS, EMBEDDING_MAX_QUEUE, 503)
+search_executor = BoundedExecutor("search", SEARCH_WORKERS, SEARCH_MAX_QUEUE, 503)
+ingestion_executor = BoundedExecutor("ingestion", INGESTION_WORKERS, INGESTION_MAX_QUEUE, 429)
@@ -1,237 +1,588 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-# from typing import List // python 3.8-
-import shutil
-import os
-
-from pdf_processing import process_uploaded_pdfs
-from embeddings import store_embedding_for_pdf, search_unified
-from llm import generate_answer, build_comparison_prompt, generate_answer_for_comparison, build_joint_summary_prompt, generate_answer_for_summary, build_single_summary_prompt, build_prompt_by_doc_type, rerank_by_semantic_similarity, classify_query_sementic, semantic_filter_chunks
-from collections import Counter
-import re
-
-import asyncio
-
-import nltk
-nltk.download('stopwords')
-from nltk.corpus import stopwords
-
-
-app = FastAPI()
-
-UPLOAD_DIR = "data/pdfs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-def get_contexts_for_summary(metadata: list, max_chunks: int = 30):
-    head = metadata[:max_chunks // 2]
-    tail = metadata[-max_chunks // 2:]
-    return head + tail
-
-def deduplicate_chunks(chunks):
-    seen = set()
-    unique = []
-    for item in chunks:
-        key = item['chunk'].strip()
-        if key not in seen:
-            seen.add(key)
-            unique.append(item)
-    return unique
-
-def get_head_tail_chunks(metadata, max_chunks=4):
-    head = metadata[:max_chunks // 2]
-    tail = metadata[-max_chunks // 2:]
-    return deduplicate_chunks(head + tail)
-
-@app.get("/")
-async def root():
-    return {"message": "Semantic Search + LLM API is running!"}
-
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
-
-@app.post("/upload/")
-async def upload_files(files: list[UploadFile] = File(...)):
-    uploaded_files_info = []
-    for file_obj in files:
-        contents = await file_obj.read()
-        file_path = os.path.join(UPLOAD_DIR, file_obj.filename)
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        try:
-            await asyncio.to_thread(store_embedding_for_pdf, file_path)
-            uploaded_files_info.append({"filename": file_obj.filename, "status": "processed"})
-        except Exception as e:
-            print(f"Error processing file: {file_obj.filename}, {e}")
-            uploaded_files_info.append({"filename": file_obj.filename, "status": "failed", "error": str(e)})
-    return {"uploaded_files_info": uploaded_files_info}
-
-async def generate_summary_async(query: str, contexts: list):
-    single_prompt = build_single_summary_prompt(query, contexts)
-    return await generate_answer_for_summary(single_prompt)
-
-
-@app.post("/query/")
-async def query_documents(query: str = Form(...), files: list[str] = Form(...)):
-    try:
-        print("\n\n>> Currently selected files for query:", files)
-        # index, metadata = load_index()
-        # filtered_metadata = [item for item in metadata if item["filename"] in files]
-
-        query_type = classify_query_sementic(query)
-        print(">> Query type:", query_type)
-
-        retrieved_metadata_all_files = await asyncio.to_thread(search_unified, query, files, top_k=50)
-        if not retrieved_metadata_all_files:
-            return {
-                "query": query,
-                "answer": "No relevant documents found.",
-                "sources": [],
-                "query_type": query_type
-            }
-        
-        final_answer = ""
-        final_sources = []
-
-        if query_type == "summary":
-            contexts_by_file = {file_name: [] for file_name in files}
-            for item in retrieved_metadata_all_files:
-                if item["filename"] in contexts_by_file:
-                    contexts_by_file[item["filename"]].append(item)
-            
-            summary_tasks = []
-            valid_files_for_summaries = []
-
-            for file_name, contexts in contexts_by_file.items():
-                if contexts:
-                    summary_tasks.append(generate_summary_async("summarize this document", contexts[:10]))
-                    valid_files_for_summaries.append(file_name)
-
-            if not summary_tasks:
-                final_answer = "No valid contexts found for summarization."
-            else:
-                individual_summaries_results = await asyncio.gather(*summary_tasks)
-
-                summaries_files = {}
-                for i, file_name in enumerate(valid_files_for_summaries):
-                    summaries_files[file_name] = individual_summaries_results[i]
-
-                prompt_summary = build_joint_summary_prompt(query, summaries_files)
-                final_answer = await generate_answer_for_summary(prompt_summary)
-
-                final_sources = [
-                    {
-                        "filename": file,
-                        "summary_chunk": summaries_files.get(file, "N/A"),
-                        "original_top_chunks_count": len(contexts_by_file.get(file, [])[:10]),
-                    } for file in valid_files_for_summaries
-                ]
-            
-        elif query_type == "comparison":
-            if len(files) > 1:
-                contexts_by_file = {file_name: [] for file_name in files}
-                for item in retrieved_metadata_all_files:
-                    if item["filename"] in contexts_by_file:
-                        contexts_by_file[item["filename"]].append(item)
-
-                summary_tasks = []
-                valid_files_for_comparison = []
-
-                for file_name, contexts in contexts_by_file.items():
-                    if contexts:
-                        summary_tasks.append(generate_summary_async("summarize this document", contexts[:10]))
-                        valid_files_for_comparison.append(file_name)
-
-                if not summary_tasks:
-                    final_answer = "No valid contexts found for comparison."
-                else:
-                    individual_summaries_results = await asyncio.gather(*summary_tasks)
-
-                    summaries_files = {}
-                    for i, file_name in enumerate(valid_files_for_comparison):
-                        summaries_files[file_name] = individual_summaries_results[i]
-
-                    prompt_comparison = build_comparison_prompt(query, summaries_files)
-                    final_answer = await generate_answer_for_comparison(prompt_comparison)
-
-                    final_sources = [
-                        {
-                            "filename": file,
-                            "summary_chunk": summaries_files.get(file, "N/A"),
-                            "original_top_chunks_count": len(contexts_by_file.get(file, [])[:10]),
-                        } for file in valid_files_for_comparison
-                    ] 
-
-            elif len(files) == 1:
-                single_file = files[0]
-                single_file_metadata = [item for item in retrieved_metadata_all_files if item["filename"] == single_file]
-
-                if not single_file_metadata:
-                    final_answer = "No valid contexts found for comparison."
-                else:
-                    relevant_contexts = await asyncio.to_thread(rerank_by_semantic_similarity, query, single_file_metadata, top_k=8)
-
-                    if not relevant_contexts:
-                        final_answer = f"No relevant contexts found for comparison in {single_file}."
-                    else:
-                        print(f"\n📌 Selected final context chunks for single-file comparison from {single_file}:")
-                        for i, ctx in enumerate(relevant_contexts):
-                            print(f"\n--- Context {i+1} ---\n{ctx['chunk']}\n")
-
-                            dominant_doc_type = relevant_contexts[0].get("doc_type", "general")
-                            prompt_comparison_single = build_prompt_by_doc_type(
-                                f"Answer the questions based on following context, {query}:", 
-                                relevant_contexts, 
-                                dominant_doc_type
-                            )
-                            final_answer = await generate_answer(prompt_comparison_single)
-                            final_sources = relevant_contexts
-
-            else:
-                final_answer = "No valid contexts found for comparison."
-         
-        else: # normal query processing
-            relevant_contexts = await asyncio.to_thread(rerank_by_semantic_similarity, query, retrieved_metadata_all_files, top_k=8)
-
-            if not relevant_contexts:
-                final_answer = "No relevant contexts found."
-            else:
-                print(f"\n📌 Selected final context chunks for query:")
-                for i, ctx in enumerate(relevant_contexts):
-                    print(f"\n--- Context {i+1} ---\n{ctx['chunk']}\n")
-
-                doc_type_counts = Counter(ctx.get("doc_type", "general") for ctx in relevant_contexts)
-                dominant_doc_type = doc_type_counts.most_common(1)[0][0] if doc_type_counts else "general"
-
-                prompt = build_prompt_by_doc_type(query, relevant_contexts, dominant_doc_type)
-                final_answer = await generate_answer(prompt)
-                final_sources = relevant_contexts
-        
-        return {
-            "query": query,
-            "answer": final_answer,
-            "sources": final_sources,
-            "query_type": query_type
-        }
-
-    except Exception as e:
-        print(f"Error in query processing: {e}")
-        import traceback
-        traceback.print_exc() # stack trace for debugging
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/clear/")
-async def clear_data():
-    try:
-        await asyncio.to_thread(shutil.rmtree, UPLOAD_DIR, ignore_errors=True)
-        await asyncio.to_thread(shutil.rmtree, "data/embeddings", ignore_errors=True)
-        await asyncio.to_thread(os.makedirs, UPLOAD_DIR, exist_ok=True)
-        await asyncio.to_thread(os.makedirs, "data/embeddings", exist_ok=True)
-    except Exception as e:
-        print(f"Error clearing data: {e}")
-        raise HTTPException(status_code=500, detail=f"Error clearing data:{str(e)}")
-    return {"message": "Data cleared successfully!"}
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, FileResponse
+from pydantic import BaseModel
+from starlette.routing import Match
+# from typing import List // python 3.8-
+import shutil
+import os
+
+from pdf_processing import process_uploaded_pdfs
+from embeddings import store_embedding_for_pdf, search_unified_batch, search_shard, make_citation, load_document_text, check_index_info, delete_document, index_version, resolve_search_mode, wants_query_vector, RETRIEVAL_PER_FILE_MIN
+from chunking import chunk_text_from_span
+from observability import start_trace, log_trace, log_chunks, render_metrics, logger, current_trace, REQUEST_SECONDS, REQUESTS_IN_PROGRESS, QUEUE_DEPTH
+from executors import embedding_executor, search_executor, ingestion_executor, ExecutorSaturated
+from sharding import SHARD_NODES, search_sharded_batch, encode_for_shards, forward_upload, forward_document, forward_chunk, clear_shards, shard_index_version
+from retrieval_cache import retrieval_cache, retrieval_key, store_items, load_items, load_many
+from compaction import Compactor
+from summarizer import document_sections, summarize_sections
+from snapshots import SNAPSHOT_DIR, export_snapshot, list_snapshots, import_snapshot, import_on_startup, bundle_path
+from profiling import profiling_requested, run_profiled, list_profiles, read_profile, LoopLagMonitor, PROFILE_TOKEN
+from llm import ANSWER_ERROR, SUMMARY_ERROR, generate_answer, build_comparison_prompt, generate_answer_for_comparison, build_joint_summary_prompt, generate_answer_for_summary, build_prompt_by_doc_type, rerank_by_semantic_similarity, classify_query_sementic, classify_queries_semantic, semantic_filter_chunks
+from collections import Counter
+import re
+
+import asyncio
+import json
+import time
+
+import nltk
+nltk.download('stopwords')
+from nltk.corpus import stopwords
+
+
+app = FastAPI()
+
+UPLOAD_DIR = "data/pdfs"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# required by the /admin/ endpoints, which are disabled without one (falls back to the profiling token)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or PROFILE_TOKEN
+
+# max number of batch queries whose LLM calls run at the same time
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    files: list[str]
+    search_mode: str = None
+    top_k: int = 50
+
+class ShardSearchRequest(BaseModel):
+    queries: list[str]
+    vectors: list  # one query vector (list of floats) or None per query
+    files: list[str]
+    top_k: int = 50
+    mode: str = None
+    per_file_min: int = 0
+
+async def retrieve_cached(queries: list, files: list, top_k: int = 50, mode: str = None, per_file_min: int = 0) -> tuple:
+    # (one result list per query, one retrieval cache key per query). Results come from the
+    # retrieval cache or from this node's indexes or, as a coordinator, from the shards.
+    # Partial results (a shard didn't answer) are not cached and get no key.
+    mode = resolve_search_mode(mode)
+    vectors = await encode_for_shards(queries, [wants_query_vector(query, mode) for query in queries])
+    if SHARD_NODES:
+        version = await shard_index_version(files)
+    else:
+        version = await asyncio.to_thread(index_version, files)
+    keys = [retrieval_key(query, vector, files, version, mode, top_k, per_file_min) for query, vector in zip(queries, vectors)]
+
+    results = await search_executor.run(load_many, keys)
+    misses = [position for position, items in enumerate(results) if items is None]
+    if misses:
+        missed_queries = [queries[position] for position in misses]
+        missed_vectors = [vectors[position] for position in misses]
+        missing_shards = []
+        if SHARD_NODES:
+            found, missing_shards = await search_sharded_batch(missed_queries, files, top_k, mode, per_file_min, missed_vectors)
+        else:
+            found = await search_executor.run(search_unified_batch, missed_queries, files, top_k, mode, per_file_min, missed_vectors)
+        for position, items in zip(misses, found):
+            results[position] = items
+            if missing_shards:
+                keys[position] = None  # no rerank entry either
+            else:
+                store_items(keys[position], items, keep_text=bool(SHARD_NODES))
+    return results, keys
+
+async def retrieve(queries: list, files: list, top_k: int = 50, mode: str = None, per_file_min: int = 0) -> list:
+    return (await retrieve_cached(queries, files, top_k, mode, per_file_min))[0]
+
+async def rerank(query: str, contexts: list, top_k: int = 8, cache_key: str = None) -> list:
+    # the reranked contexts are cached under the key of the retrieval they were picked from
+    if cache_key:
+        cached = await search_executor.run(load_items, cache_key, "rerank")
+        if cached is not None:
+            return cached
+    reranked = await embedding_executor.run(rerank_by_semantic_similarity, query, contexts, top_k=top_k)
+    if cache_key:
+        store_items(cache_key, reranked, keep_text=bool(SHARD_NODES))
+    return reranked
+
+async def ensure_per_file_minimum(query: str, files: list, query_type: str, retrieved: list, mode: str = None) -> list:
+    # a coordinator summarizes and compares from retrieved chunks (it has no documents of its own),
+    # so every selected file needs some, not only those in the overall top_k. The type is known
+    # only after retrieval (both run at once), so short files are topped up. A single node
+    # summarizes whole documents (summarize_files) and needs nothing more.
+    if not SHARD_NODES or query_type not in ("summary", "comparison"):
+        return retrieved
+    counts = Counter(item["filename"] for item in retrieved)
+    short_files = [file_name for file_name in files if counts[file_name] < RETRIEVAL_PER_FILE_MIN]
+    if not short_files:
+        return retrieved
+    extra = (await retrieve([query], short_files, RETRIEVAL_PER_FILE_MIN * len(short_files), mode, RETRIEVAL_PER_FILE_MIN))[0]
+    return [item for item in retrieved if item["filename"] not in short_files] + extra
+
+def get_contexts_for_summary(metadata: list, max_chunks: int = 30):
+    head = metadata[:max_chunks // 2]
+    tail = metadata[-max_chunks // 2:]
+    return head + tail
+
+# chunks are near-deduplicated at ingestion (see dedup.py), no per-query dedup pass needed
+def get_head_tail_chunks(metadata, max_chunks=4):
+    head = metadata[:max_chunks // 2]
+    tail = metadata[-max_chunks // 2:]
+    return head + tail
+
+loop_lag_monitor = LoopLagMonitor()
+compactor = Compactor()
+
+@app.on_event("startup")
+async def load_snapshot():
+    # a fresh replica pulls SNAPSHOT_SOURCE; either way, refuse to start on vectors from another model
+    await asyncio.to_thread(import_on_startup)
+    check_index_info()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    loop_lag_monitor.start()
+    compactor.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    loop_lag_monitor.stop()
+    compactor.stop()
+
+# registered before trace_requests, so it runs inside it and can reuse the request id
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    mode = profiling_requested(request.url.path, request.headers)
+    if not mode:
+        return await call_next(request)
+    response, profile_id = await run_profiled(mode, current_trace.get()["request_id"], call_next, request)
+    response.headers["X-Profile-Id"] = profile_id or "busy"  # busy: another request holds the profiler
+    return response
+
+def route_path(request: Request) -> str:
+    # metrics are labelled with the route template ("/documents/{filename}"), never the raw
+    # path, so the number of series stays bounded
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # one structured log line per request with its stage timings (see observability.py).
+    # for streamed responses this covers the time until the stream starts.
+    path = route_path(request)
+    trace = start_trace(f"{request.method} {request.url.path}")
+    REQUESTS_IN_PROGRESS.inc(path=path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace["request_id"]
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS_IN_PROGRESS.dec(path=path)
+        REQUEST_SECONDS.observe(elapsed, path=path, status=status)
+        log_trace(trace, status, elapsed)
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles/")
+async def get_profiles(request: Request):
+    check_admin_token(request)
+    return {"profiles": await asyncio.to_thread(list_profiles)}
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request, limit: int = 50):
+    check_admin_token(request)
+    text = await asyncio.to_thread(read_profile, profile_id, limit)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return PlainTextResponse(text)
+
+@app.post("/admin/snapshots/")
+async def create_snapshot(request: Request, base: str = None):
+    # base: id of an earlier snapshot to export only the changes since
+    check_admin_token(request)
+    try:
+        return await ingestion_executor.run(export_snapshot, base)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/admin/snapshots/")
+async def get_snapshots(request: Request):
+    check_admin_token(request)
+    return {"snapshots": await asyncio.to_thread(list_snapshots)}
+
+@app.get("/admin/snapshots/{snapshot_id}")
+async def download_snapshot(snapshot_id: str, request: Request):
+    check_admin_token(request)
+    path = bundle_path(snapshot_id)
+    if os.path.basename(path) != f"snapshot-{snapshot_id}.tar" or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Snapshot {snapshot_id} not found")
+    return FileResponse(path, media_type="application/x-tar", filename=os.path.basename(path))
+
+@app.post("/admin/snapshots/import")
+async def upload_snapshot(request: Request, file: UploadFile = File(...)):
+    check_admin_token(request)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, f".upload-{current_trace.get()['request_id']}.tar")
+    try:
+        with open(path, "wb") as f:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, f)
+        return await ingestion_executor.run(import_snapshot, path)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+@app.post("/admin/compact/")
+async def compact_now(request: Request):
+    # compacts every document with tombstones now, regardless of COMPACTION_THRESHOLD
+    check_admin_token(request)
+    return {"compacted": await ingestion_executor.run(compactor.compact, True)}
+
+def check_admin_token(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled: no ADMIN_TOKEN configured")
+    token = request.headers.get("x-admin-token") or request.headers.get("x-profile-token")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/")
+async def root():
+    return {"message": "Semantic Search + LLM API is running!"}
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.post("/upload/")
+async def upload_files(files: list[UploadFile] = File(...)):
+    if SHARD_NODES:
+        return {"uploaded_files_info": await forward_uploads(files)}
+
+    # files are ingested one after another, so the upload needs a single slot; it is rejected
+    # before anything is written if the ingestion queue can't take it
+    ingestion_executor.check_capacity()
+    uploaded_files_info = []
+    for file_obj in files:
+        contents = await file_obj.read()
+        file_path = os.path.join(UPLOAD_DIR, file_obj.filename)
+        with open(file_path, "wb") as f:
+            f.write(contents)
+        
+        try:
+            await ingestion_executor.run(store_embedding_for_pdf, file_path)
+            uploaded_files_info.append({"filename": file_obj.filename, "status": "processed"})
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            logger.warning("Error processing file %s: %s", file_obj.filename, e)
+            uploaded_files_info.append({"filename": file_obj.filename, "status": "failed", "error": str(e)})
+    return {"uploaded_files_info": uploaded_files_info}
+
+async def forward_uploads(files: list):
+    # coordinator: each file is ingested by the shard that owns its filename
+    async def forward(file_obj):
+        try:
+            return await forward_upload(file_obj.filename, await file_obj.read())
+        except Exception as e:
+            logger.warning("Error forwarding file %s: %s", file_obj.filename, e)
+            return {"filename": file_obj.filename, "status": "failed", "error": str(e)}
+    return await asyncio.gather(*(forward(file_obj) for file_obj in files))
+
+@app.put("/documents/{filename}")
+async def replace_document(filename: str, file: UploadFile = File(...)):
+    # re-indexes one document in place; unchanged chunks keep their vectors
+    if os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if SHARD_NODES:
+        return shard_response(await forward_document("PUT", filename, await file.read()))
+
+    ingestion_executor.check_capacity()
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    with open(file_path, "wb") as f:
+        f.write(await file.read())
+    stats = await ingestion_executor.run(store_embedding_for_pdf, file_path)
+    if not stats:
+        raise HTTPException(status_code=422, detail=f"No text could be extracted from {filename}")
+    return {**stats, "status": "replaced"}
+
+@app.delete("/documents/{filename}")
+async def remove_document(filename: str):
+    # the document leaves search results immediately; compaction reclaims its files later
+    if os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if SHARD_NODES:
+        return shard_response(await forward_document("DELETE", filename))
+
+    if not await ingestion_executor.run(delete_document, filename):
+        raise HTTPException(status_code=404, detail=f"{filename} is not indexed")
+    pdf_path = os.path.join(UPLOAD_DIR, filename)
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)
+    compactor.request()
+    return {"filename": filename, "status": "deleted"}
+
+def shard_response(response):
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.json().get("detail"))
+    return response.json()
+
+async def summarize_files(files: list, retrieved_metadata_all_files: list) -> dict:
+    # {filename: (summary, number of chunks summarized)} for every selected file with content.
+    # Each document is summarized whole, hierarchically (see summarizer.py), not from its top chunks;
+    # a coordinator only has the retrieved chunks, so there it covers the files retrieval matched.
+    contexts_by_file = {file_name: [] for file_name in files}
+    for item in retrieved_metadata_all_files:
+        if item["filename"] in contexts_by_file:
+            contexts_by_file[item["filename"]].append(item)
+
+    async def summarize(file_name):
+        sections = [] if SHARD_NODES else await search_executor.run(document_sections, file_name)
+        if not sections:
+            # sharded coordinator (no local chunks) or unreadable index: use what retrieval returned
+            contexts = sorted(contexts_by_file[file_name], key=lambda item: item.get("start", 0))
+            sections = [item["chunk"] for item in contexts]
+        if not sections:
+            return None
+        return await summarize_sections(sections), len(sections)
+
+    valid_files = [file_name for file_name, contexts in contexts_by_file.items() if contexts or not SHARD_NODES]
+    results = await asyncio.gather(*(summarize(file_name) for file_name in valid_files))
+    failed = [file_name for file_name, result in zip(valid_files, results) if result is not None and result[0] == SUMMARY_ERROR]
+    if failed:
+        # the LLM call failed: no joint answer from a partial set, and a 5xx keeps clients from caching it
+        raise HTTPException(status_code=502, detail=f"{SUMMARY_ERROR} ({', '.join(failed)})")
+    return {file_name: result for file_name, result in zip(valid_files, results) if result is not None}
+
+
+async def answer_query(query: str, files: list, query_type: str, retrieved_metadata_all_files: list, cache_key: str = None) -> dict:
+    # everything after retrieval: per-type context selection, prompt building and LLM calls.
+    # cache_key is the retrieval cache key of retrieved_metadata_all_files, if it has one.
+    if not retrieved_metadata_all_files:
+        return {
+            "query": query,
+            "answer": "No relevant documents found.",
+            "sources": [],
+            "query_type": query_type
+        }
+
+    final_answer = ""
+    final_sources = []
+
+    if query_type == "summary":
+        summaries = await summarize_files(files, retrieved_metadata_all_files)
+
+        if not summaries:
+            final_answer = "No valid contexts found for summarization."
+        else:
+            summaries_files = {file: summary for file, (summary, _) in summaries.items()}
+            prompt_summary = build_joint_summary_prompt(query, summaries_files)
+            final_answer = await generate_answer_for_summary(prompt_summary)
+
+            final_sources = [
+                {
+                    "filename": file,
+                    "summary_chunk": summary,
+                    "summarized_chunks": count,
+                } for file, (summary, count) in summaries.items()
+            ]
+        
+    elif query_type == "comparison":
+        if len(files) > 1:
+            summaries = await summarize_files(files, retrieved_metadata_all_files)
+
+            if not summaries:
+                final_answer = "No valid contexts found for comparison."
+            else:
+                summaries_files = {file: summary for file, (summary, _) in summaries.items()}
+                prompt_comparison = build_comparison_prompt(query, summaries_files)
+                final_answer = await generate_answer_for_comparison(prompt_comparison)
+
+                final_sources = [
+                    {
+                        "filename": file,
+                        "summary_chunk": summary,
+                        "summarized_chunks": count,
+                    } for file, (summary, count) in summaries.items()
+                ] 
+
+        elif len(files) == 1:
+            single_file = files[0]
+            single_file_metadata = [item for item in retrieved_metadata_all_files if item["filename"] == single_file]
+
+            if not single_file_metadata:
+                final_answer = "No valid contexts found for comparison."
+            else:
+                relevant_contexts = await rerank(query, single_file_metadata, 8, cache_key and f"{cache_key}:rerank:{single_file}")
+
+                if not relevant_contexts:
+                    final_answer = f"No relevant contexts found for comparison in {single_file}."
+                else:
+                    log_chunks(f"📌 Selected context for single-file comparison from {single_file}", relevant_contexts)
+
+                    dominant_doc_type = relevant_contexts[0].get("doc_type", "general")
+                    prompt_comparison_single = build_prompt_by_doc_type(
+                        f"Answer the questions based on following context, {query}:", 
+                        relevant_contexts, 
+                        dominant_doc_type
+                    )
+                    final_answer = await generate_answer(prompt_comparison_single)
+                    final_sources = [make_citation(ctx) for ctx in relevant_contexts]
+
+        else:
+            final_answer = "No valid contexts found for comparison."
+     
+    else: # normal query processing
+        relevant_contexts = await rerank(query, retrieved_metadata_all_files, 8, cache_key and f"{cache_key}:rerank")
+
+        if not relevant_contexts:
+            final_answer = "No relevant contexts found."
+        else:
+            log_chunks("📌 Selected context for query", relevant_contexts)
+
+            doc_type_counts = Counter(ctx.get("doc_type", "general") for ctx in relevant_contexts)
+            dominant_doc_type = doc_type_counts.most_common(1)[0][0] if doc_type_counts else "general"
+
+            prompt = build_prompt_by_doc_type(query, relevant_contexts, dominant_doc_type)
+            final_answer = await generate_answer(prompt)
+            final_sources = [make_citation(ctx) for ctx in relevant_contexts]
+    
+    return {
+        "query": query,
+        "answer": final_answer,
+        "sources": final_sources,
+        "query_type": query_type
+    }
+
+
+@app.post("/query/")
+async def query_documents(query: str = Form(...), files: list[str] = Form(...), search_mode: str = Form(None)):
+    try:
+        logger.info(">> Currently selected files for query: %s", files)
+        # index, metadata = load_index()
+        # filtered_metadata = [item for item in metadata if item["filename"] in files]
+
+        # classification and retrieval are independent, so they run side by side off the event loop
+        query_type, retrieved_metadata_all_files = await asyncio.gather(
+            embedding_executor.run(classify_query_sementic, query),
+            retrieve_cached([query], files, top_k=50, mode=search_mode),
+        )
+        (retrieved_metadata_all_files,), (cache_key,) = retrieved_metadata_all_files
+        retrieved_metadata_all_files = await ensure_per_file_minimum(query, files, query_type, retrieved_metadata_all_files, search_mode)
+        logger.info(">> Query type: %s", query_type)
+
+        result = await answer_query(query, files, query_type, retrieved_metadata_all_files, cache_key)
+        if result["answer"] in (ANSWER_ERROR, SUMMARY_ERROR):
+            # the LLM call failed: a 5xx keeps clients (and their caches) from taking it as the answer
+            raise HTTPException(status_code=502, detail=result["answer"])
+        return result
+
+    except (ExecutorSaturated, HTTPException):
+        raise
+    except Exception as e:
+        logger.exception("Error in query processing: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/batch/")
+async def query_documents_batch(request: BatchQueryRequest):
+    # regression-suite endpoint: many questions against one file set. Indexes are loaded once,
+    # queries are classified and encoded in batches, and answers stream back as NDJSON lines
+    # ({"index": i, ...same fields as /query/...}) in completion order.
+    if not request.queries or not request.files:
+        raise HTTPException(status_code=400, detail="queries and files must not be empty")
+
+    # done before streaming starts, so a saturated executor can still answer with 429/503
+    query_types, (retrieved_all, cache_keys) = await asyncio.gather(
+        embedding_executor.run(classify_queries_semantic, request.queries),
+        retrieve_cached(request.queries, request.files, request.top_k, request.search_mode),
+    )
+    retrieved_all = await asyncio.gather(*(
+        ensure_per_file_minimum(request.queries[position], request.files, query_types[position], retrieved_all[position], request.search_mode)
+        for position in range(len(request.queries))
+    ))
+
+    async def stream_answers():
+        llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+        async def answer_one(position):
+            QUEUE_DEPTH.inc(queue="batch_llm")
+            try:
+                async with llm_slots:
+                    try:
+                        result = await answer_query(request.queries[position], request.files, query_types[position], retrieved_all[position], cache_keys[position])
+                    except Exception as e:
+                        logger.warning("Error in batch query %d: %s", position, e)
+                        result = {"query": request.queries[position], "query_type": query_types[position], "error": str(e)}
+            finally:
+                QUEUE_DEPTH.dec(queue="batch_llm")
+            return {"index": position, **result}
+
+        tasks = [asyncio.create_task(answer_one(position)) for position in range(len(request.queries))]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, default=str) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()  # client went away: don't keep spending LLM calls
+
+    return StreamingResponse(stream_answers(), media_type="application/x-ndjson")
+
+@app.post("/search/")
+async def search_documents(query: str = Form(...), files: list[str] = Form(...), search_mode: str = Form(None), top_k: int = Form(50)):
+    # retrieval only, no LLM: the citations /query/ would pick its contexts from
+    results = (await retrieve([query], files, top_k, search_mode))[0]
+    return {"query": query, "results": [make_citation(item) for item in results]}
+
+@app.post("/shard/search/")
+async def shard_search(request: ShardSearchRequest):
+    # called by a coordinator (see sharding.py) with query vectors it already encoded
+    return await search_executor.run(search_shard, request.queries, request.vectors, request.files, request.top_k, request.mode, request.per_file_min)
+
+@app.get("/chunk/")
+async def get_chunk(filename: str, start: int, end: int):
+    # full text behind a citation returned by /query/
+    if os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if SHARD_NODES:
+        return shard_response(await forward_chunk(filename, start, end))
+    text = await search_executor.run(load_document_text, filename)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"No extracted text for {filename}")
+    if start < 0 or end > len(text) or start > end:
+        raise HTTPException(status_code=400, detail="Span out of range")
+    return {"filename": filename, "start": start, "end": end, "chunk": chunk_text_from_span(text, start, end)}
+
+@app.get("/index/version/")
+async def get_index_version(files: list[str] = Query([])):
+    # lets clients cache answers: the version only changes when one of these documents does
+    if SHARD_NODES:
+        return {"index_version": await shard_index_version(files)}
+    return {"index_version": await asyncio.to_thread(index_version, files)}
+
+@app.post("/clear/")
+async def clear_data():
+    if SHARD_NODES:
+        failed = await clear_shards()
+        if failed:
+            raise HTTPException(status_code=502, detail=f"Error clearing shards: {', '.join(failed)}")
+    try:
+        await asyncio.to_thread(shutil.rmtree, UPLOAD_DIR, ignore_errors=True)
+        await asyncio.to_thread(shutil.rmtree, "data/embeddings", ignore_errors=True)
+        await asyncio.to_thread(os.makedirs, UPLOAD_DIR, exist_ok=True)
+        await asyncio.to_thread(os.makedirs, "data/embeddings", exist_ok=True)
+        retrieval_cache.clear()
+    except Exception as e:
+        logger.exception("Error clearing data: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error clearing data:{str(e)}")
+    return {"message": "Data cleared successfully!"}
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,4 +1,4 @@
-from sentence_transformers import SentenceTransformer
-
-MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 model = SentenceTransformer(MODEL_NAME)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Per-request stage tracing and Prometheus-style metrics, without extra dependencies.
+# stage("search") times a block, records it in the stage histogram and in the current
+# request's trace; the middleware in main.py logs one line per request with all stage timings.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# fraction of requests whose full context chunks are logged (and only at DEBUG level)
+CHUNK_LOG_SAMPLE_RATE = float(os.getenv("CHUNK_LOG_SAMPLE_RATE", "0.1"))
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger("docinsight")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # label key -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in self.series.items():
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {series[i]}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("docinsight_stage_seconds", "Time spent per pipeline stage")
+REQUEST_SECONDS = Histogram("docinsight_request_seconds", "HTTP request latency")
+CACHE_REQUESTS = Counter("docinsight_cache_requests_total", "Cache lookups by cache and result (hit/miss)")
+QUEUE_DEPTH = Gauge("docinsight_queue_depth", "Work items waiting or running per queue")
+REQUESTS_IN_PROGRESS = Gauge("docinsight_requests_in_progress", "HTTP requests currently being served")
+
+METRICS = [STAGE_SECONDS, REQUEST_SECONDS, CACHE_REQUESTS, QUEUE_DEPTH, REQUESTS_IN_PROGRESS]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(name: str) -> dict:
+    # the dict is shared by reference, so stages recorded inside asyncio.to_thread land here too
+    trace = {"request_id": uuid.uuid4().hex[:12], "name": name, "stages": [], "sample_chunks": random.random() < CHUNK_LOG_SAMPLE_RATE}
+    current_trace.set(trace)
+    return trace
+
+
+def log_trace(trace: dict, status: int, elapsed: float):
+    logger.info(json.dumps({
+        "request_id": trace["request_id"],
+        "request": trace["name"],
+        "status": status,
+        "ms": round(elapsed * 1000, 1),
+        "stages": [{"stage": stage, "ms": round(seconds * 1000, 1)} for stage, seconds in trace["stages"]],
+    }))
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace["stages"].append((name, elapsed))
+
+
+def timed(name: str):
+    # decorator form of stage(), for sync and async functions
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def log_chunks(title: str, chunks: list, key: str = "chunk"):
+    # dumping every context chunk costs real time under load: DEBUG only, and only for sampled requests
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    trace = current_trace.get()
+    if trace is not None and not trace["sample_chunks"]:
+        return
+    logger.debug("%s (%d chunks)", title, len(chunks))
+    for i, chunk in enumerate(chunks):
+        text = chunk[key] if isinstance(chunk, dict) else chunk
+        logger.debug("--- %s %d ---\n%s", title, i + 1, text)
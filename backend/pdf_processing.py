@@ -1,28 +1,46 @@
-import fitz  # PyMuPDF
-import os
-from typing import List
-
-def extract_text_from_pdf(pdf_path: str) -> str:
-    try:
-        doc = fitz.open(pdf_path)
-        text = "\n".join([page.get_text("text") for page in doc])
-        return text.strip()
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return ""
-
-def process_uploaded_pdfs(pdf_dir: str) -> List[dict]:
-    extracted_data = []
-    for pdf_file in os.listdir(pdf_dir):
-        if pdf_file.endswith(".pdf"):
-            pdf_path = os.path.join(pdf_dir, pdf_file)
-            text = extract_text_from_pdf(pdf_path)
-            extracted_data.append({"filename": pdf_file, "text": text})
-    return extracted_data
-
-if __name__ == "__main__":
-    pdf_dir = "../data/pdfs"
-    os.makedirs(pdf_dir, exist_ok=True)
-    processed_data = process_uploaded_pdfs(pdf_dir)
-    for entry in processed_data:
-        print(f"Processed: {entry['filename']} - {len(entry['text'])} characters extracted.")
+import fitz  # PyMuPDF
+import os
+from typing import List
+from observability import timed
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    return extract_text_with_pages(pdf_path)[0]
+
+@timed("extraction")
+def extract_text_with_pages(pdf_path: str):
+    # returns (text, page_starts) where page_starts[i] is the offset of page i + 1 in text
+    try:
+        doc = fitz.open(pdf_path)
+        pages = [page.get_text("text") for page in doc]
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return "", []
+
+    page_starts = []
+    offset = 0
+    for page_text in pages:
+        page_starts.append(offset)
+        offset += len(page_text) + 1  # pages are joined with "\n"
+    text = "\n".join(pages)
+
+    # offsets are relative to the stripped text
+    lead = len(text) - len(text.lstrip())
+    text = text.strip()
+    page_starts = [max(start - lead, 0) for start in page_starts]
+    return text, page_starts
+
+def process_uploaded_pdfs(pdf_dir: str) -> List[dict]:
+    extracted_data = []
+    for pdf_file in os.listdir(pdf_dir):
+        if pdf_file.endswith(".pdf"):
+            pdf_path = os.path.join(pdf_dir, pdf_file)
+            text = extract_text_from_pdf(pdf_path)
+            extracted_data.append({"filename": pdf_file, "text": text})
+    return extracted_data
+
+if __name__ == "__main__":
+    pdf_dir = "../data/pdfs"
+    os.makedirs(pdf_dir, exist_ok=True)
+    processed_data = process_uploaded_pdfs(pdf_dir)
+    for entry in processed_data:
+        print(f"Processed: {entry['filename']} - {len(entry['text'])} characters extracted.")
@@ -0,0 +1,207 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from observability import logger, Histogram, METRICS
+
+# Opt-in profiling of single requests, plus an event-loop lag monitor.
+#
+# A request to /query/ or /upload/ carrying "X-Profile: cprofile" or "X-Profile: sample" is run
+# under the chosen profiler when PROFILING_ENABLED is set (and X-Profile-Token matches
+# PROFILE_TOKEN, if one is configured). The profile is stored under PROFILE_DIR and its id is
+# returned in the X-Profile-Id response header; /admin/profiles/ lists and serves them.
+#
+#   cprofile: deterministic, but only sees the event-loop thread (not asyncio.to_thread work)
+#   sample:   samples the stacks of every thread, so torch / FAISS / unpickling in worker
+#             threads shows up; output is collapsed stacks (flamegraph.pl / speedscope)
+#
+# Profiles cover everything the process did while the request ran, including other requests.
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = "data/profiles"
+PROFILED_PATHS = ("/query/", "/upload/")
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+
+LOOP_LAG_SECONDS = Histogram("docinsight_event_loop_lag_seconds", "How late the event loop ran a periodic tick",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+METRICS.append(LOOP_LAG_SECONDS)
+
+# cProfile and the sampler are process-wide: one profiled request at a time
+profile_lock = threading.Lock()
+
+
+def profiling_requested(path: str, headers) -> str:
+    # returns the profiler to use for this request, or "" when it should run normally
+    mode = headers.get("x-profile", "").lower()
+    if not PROFILING_ENABLED or mode not in ("cprofile", "sample") or path not in PROFILED_PATHS:
+        return ""
+    if PROFILE_TOKEN and headers.get("x-profile-token") != PROFILE_TOKEN:
+        return ""
+    return mode
+
+
+class StackSampler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while self.running:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+async def run_profiled(mode: str, request_id: str, call_next, request):
+    # runs the request under the profiler and stores the result; returns (response, profile_id)
+    if not profile_lock.acquire(blocking=False):
+        return await call_next(request), None
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+            profile_id = f"{request_id}.prof"
+            await asyncio.to_thread(profiler.dump_stats, os.path.join(PROFILE_DIR, profile_id))
+        else:
+            sampler = StackSampler()
+            sampler.start()
+            try:
+                response = await call_next(request)
+            finally:
+                sampler.stop()
+            profile_id = f"{request_id}.collapsed"
+            await asyncio.to_thread(write_text, os.path.join(PROFILE_DIR, profile_id), sampler.collapsed())
+    finally:
+        profile_lock.release()
+
+    logger.info("Stored %s profile %s for %s", mode, profile_id, request.url.path)
+    return response, profile_id
+
+
+def write_text(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def list_profiles() -> list:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR)):
+        path = os.path.join(PROFILE_DIR, name)
+        profiles.append({"id": name, "bytes": os.path.getsize(path), "created": os.path.getmtime(path)})
+    return profiles
+
+
+def read_profile(profile_id: str, limit: int = 50):
+    # returns readable text for a stored profile, or None if there is no such profile
+    if os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id)
+    if not os.path.exists(path):
+        return None
+    if profile_id.endswith(".prof"):
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+    with open(path) as f:
+        return f.read()
+
+
+class LoopLagMonitor:
+    # a periodic tick on the loop measures how late it runs; a watchdog thread notices when the
+    # tick stops altogether and logs what the loop thread is doing at that moment, which is
+    # what points at sync work accidentally run inside an async handler
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_tick = time.monotonic()
+        self.loop_thread_id = None
+        self.task = None
+        self.running = False
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()  # not since import: startup hooks may have run for a while
+        self.running = True
+        self.task = asyncio.get_running_loop().create_task(self._tick())
+        threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+    async def _tick(self):
+        while self.running:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self.last_tick = now
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.threshold:
+                logger.warning("Event loop lagged %.3fs behind schedule", lag)
+
+    def _watch(self):
+        reported_stall = None
+        while self.running:
+            time.sleep(self.interval)
+            stalled = time.monotonic() - self.last_tick - self.interval
+            if stalled <= self.threshold:
+                reported_stall = None
+                continue
+            if reported_stall == self.last_tick:
+                continue  # one stack per stall is enough
+            reported_stall = self.last_tick
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning("Event loop blocked for %.3fs, loop thread is in:\n%s", stalled, stack)
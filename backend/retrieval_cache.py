@@ -0,0 +1,86 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from bm25 import tokenize
+from embeddings import hydrate_chunks
+from observability import record_cache
+
+# In-memory cache of retrieval results, so asking the same question of the same files again
+# (regenerating an answer, a retried request, a UI rerun) skips the index searches, the merge
+# and the rerank.
+#
+# A key combines the query embedding rounded to multiples of 1/RETRIEVAL_CACHE_QUANTIZATION (or
+# the query's BM25 terms when it is only searched lexically), the search parameters and the
+# index version of the selected files (embeddings.index_version). Re-ingesting, deleting or
+# compacting a file changes its version, so stale entries are never read again and simply age
+# out of the LRU. Entries are chunk references (metadata without the text), hydrated on a hit.
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))  # entries; 0 disables the cache
+RETRIEVAL_CACHE_QUANTIZATION = int(os.getenv("RETRIEVAL_CACHE_QUANTIZATION", "127"))
+
+
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE)
+
+
+def query_key(query: str, vector=None) -> str:
+    if vector is None:
+        # BM25 scores depend on the set of query terms only
+        return "terms:" + " ".join(sorted(set(tokenize(query))))
+    quantized = np.round(np.asarray(vector, dtype="float32") * RETRIEVAL_CACHE_QUANTIZATION).astype("int16")
+    return "vector:" + hashlib.sha256(quantized.tobytes()).hexdigest()
+
+
+def retrieval_key(query: str, vector, files: list, version: str, mode: str, top_k: int, per_file_min: int = 0) -> str:
+    parts = [query_key(query, vector), version, mode, str(top_k), str(per_file_min)] + sorted(files)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def store_items(key: str, items: list, keep_text: bool = False):
+    # the text is dropped where the item's span can hydrate it again; corpus-deduplicated items
+    # keep theirs (it comes from another document), as do items from shards (keep_text)
+    refs = [item if keep_text or "start" not in item or item.get("duplicate_of")
+            else {field: value for field, value in item.items() if field != "chunk"}
+            for item in items]
+    retrieval_cache.put(key, refs)
+
+
+def load_items(key: str, cache: str = "retrieval"):
+    # the cached items, hydrated; None on a miss
+    refs = retrieval_cache.get(key)
+    record_cache(cache, refs is not None)
+    return None if refs is None else hydrate_chunks(refs)
+
+
+def load_many(keys: list, cache: str = "retrieval") -> list:
+    return [load_items(key, cache) for key in keys]
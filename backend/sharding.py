@@ -0,0 +1,220 @@
+import asyncio
+import bisect
+import hashlib
+import os
+from collections import defaultdict
+from urllib.parse import quote
+
+import httpx
+
+from bm25 import reciprocal_rank_fusion
+from embeddings import resolve_search_mode, encode_queries, keep_per_file_minimum, wants_query_vector
+from executors import embedding_executor
+from observability import Counter, METRICS, logger, stage
+
+# Scatter-gather search across several backend nodes.
+#
+# With SHARD_NODES set (comma-separated base URLs), this backend acts as a coordinator: every
+# document lives on exactly one shard, picked by consistent hashing on its filename, so adding
+# a node only moves about 1/N of the documents. Uploads, /chunk/ and /clear/ are forwarded to
+# the owning shards. A search encodes the queries once here, sends the vectors to the shards
+# that own the selected files (/shard/search/), and merges their rankings: dense by cosine
+# score, lexical by BM25 score, then the same rank fusion as single-node search.
+#
+# Shards are ordinary backends without SHARD_NODES. A shard that errors or misses
+# SHARD_DEADLINE is left out of the result (logged and counted) instead of failing the query.
+# Cross-corpus dedup (DEDUP_ACROSS_CORPUS) only sees documents on the same shard.
+
+SHARD_NODES = [node.strip().rstrip("/") for node in os.getenv("SHARD_NODES", "").split(",") if node.strip()]
+SHARD_DEADLINE = float(os.getenv("SHARD_DEADLINE", "2.0"))
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+SHARD_UPLOAD_TIMEOUT = float(os.getenv("SHARD_UPLOAD_TIMEOUT", "600"))
+SHARD_CLEAR_TIMEOUT = float(os.getenv("SHARD_CLEAR_TIMEOUT", "120"))  # /clear/ removes whole directories
+
+SHARD_FAILURES = Counter("docinsight_shard_failures_total", "Shard requests that failed or missed the deadline")
+METRICS.append(SHARD_FAILURES)
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=SHARD_DEADLINE)
+    return _client
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes, virtual_nodes=SHARD_VIRTUAL_NODES):
+        self.points = sorted((_ring_hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes))
+        self.hashes = [point for point, _ in self.points]
+
+    def owner(self, filename: str) -> str:
+        i = bisect.bisect(self.hashes, _ring_hash(filename)) % len(self.points)
+        return self.points[i][1]
+
+    def group(self, filenames) -> dict:
+        by_node = defaultdict(list)
+        for filename in filenames:
+            by_node[self.owner(filename)].append(filename)
+        return by_node
+
+
+ring = HashRing(SHARD_NODES) if SHARD_NODES else None
+
+
+async def fan_out(requests_by_node: dict, path: str, deadline: float = SHARD_DEADLINE) -> dict:
+    # POSTs each node its payload concurrently; returns {node: json} for the nodes that answered in time
+    async def call(node, payload):
+        response = await get_client().post(f"{node}{path}", json=payload, timeout=deadline)
+        response.raise_for_status()
+        return response.json()
+
+    tasks = {asyncio.create_task(call(node, payload)): node for node, payload in requests_by_node.items()}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+        logger.warning("Shard %s missed the %.1fs deadline, answering without it", tasks[task], deadline)
+        SHARD_FAILURES.inc(shard=tasks[task], reason="deadline")
+
+    answers = {}
+    for task in done:
+        node = tasks[task]
+        try:
+            answers[node] = task.result()
+        except Exception as e:
+            logger.warning("Shard %s failed, answering without it: %s", node, e)
+            SHARD_FAILURES.inc(shard=node, reason="error")
+    return answers
+
+
+async def search_shards(queries, vectors, filenames, top_k, mode, per_file_min=0, batch_positions=None):
+    # per query: (dense ranking, lexical ranking) as [(score, item key)], plus {item key: item}
+    # and the nodes that didn't answer. batch_positions: where the queries sit in the caller's
+    # batch (a retry round searches a subset), so keys from both rounds don't collide
+    batch_positions = batch_positions or list(range(len(queries)))
+    by_node = ring.group(filenames)
+    payloads = {node: {"queries": queries, "vectors": vectors, "files": files, "top_k": top_k, "mode": mode,
+                       "per_file_min": per_file_min}
+                for node, files in by_node.items()}
+    with stage("shard_fan_out"):
+        answers = await fan_out(payloads, "/shard/search/")
+
+    dense = [[] for _ in queries]
+    lexical = [[] for _ in queries]
+    items = {}
+    for node, results in answers.items():
+        for position, result in enumerate(results):
+            keys = []
+            for slot, item in enumerate(result["items"]):
+                # filenames live on exactly one shard, so filename + span is unique corpus-wide;
+                # metadata stored before spans were recorded has none, there the position is the key
+                if item.get("chunk_index") is None and item.get("start") is None:
+                    key = (item["filename"], "position", batch_positions[position], slot)
+                else:
+                    key = (item["filename"], item.get("chunk_index"), item.get("start"), item.get("duplicate_of"))
+                items[key] = item
+                keys.append(key)
+            dense[position].extend((score, keys[slot]) for score, slot in result["dense"])
+            lexical[position].extend((score, keys[slot]) for score, slot in result["lexical"])
+
+    for position in range(len(queries)):
+        dense[position] = keep_per_file_minimum(sorted(dense[position], key=lambda x: x[0], reverse=True), top_k, per_file_min, lambda entry: entry[1][0])
+        lexical[position] = keep_per_file_minimum(sorted(lexical[position], key=lambda x: x[0], reverse=True), top_k, per_file_min, lambda entry: entry[1][0])
+    return dense, lexical, items, [node for node in payloads if node not in answers]
+
+
+def fuse_shard_rankings(dense_ranking, lexical_ranking, mode, top_k, per_file_min=0):
+    if mode == "lexical" or not dense_ranking:
+        return [key for _, key in lexical_ranking]
+    if mode == "dense" or not lexical_ranking:
+        return [key for _, key in dense_ranking]
+    fused = reciprocal_rank_fusion([[key for _, key in dense_ranking], [key for _, key in lexical_ranking]])
+    return keep_per_file_minimum([key for key, _ in fused], top_k, per_file_min, lambda key: key[0])
+
+
+async def search_sharded_batch(queries: list, filenames: list, top_k: int = 50, mode: str = None, per_file_min: int = 0, vectors: list = None) -> tuple:
+    # coordinator version of embeddings.search_unified_batch: (results in the same shape, shards
+    # that missed the deadline or failed). With missing shards the results are partial.
+    if not filenames:
+        logger.warning("Empty filenames list")
+        return [[] for _ in queries], []
+    mode = resolve_search_mode(mode)
+
+    # hybrid keyword queries only go to the encoder if no shard found them lexically
+    if vectors is None:
+        vectors = await encode_for_shards(queries, [wants_query_vector(query, mode) for query in queries])
+    dense, lexical, items, missing = await search_shards(queries, vectors, filenames, top_k, mode, per_file_min)
+
+    retry = [position for position, query in enumerate(queries)
+             if query.strip() and mode == "hybrid" and vectors[position] is None and not lexical[position]]
+    if retry:
+        retry_vectors = await encode_for_shards([queries[position] for position in retry], [True] * len(retry))
+        retry_dense, _, retry_items, retry_missing = await search_shards([queries[position] for position in retry], retry_vectors, filenames, top_k, "dense", per_file_min, retry)
+        items.update(retry_items)
+        missing = sorted(set(missing) | set(retry_missing))
+        for position, ranking in zip(retry, retry_dense):
+            dense[position] = ranking
+
+    results = [[items[key] for key in fuse_shard_rankings(dense[position], lexical[position], mode, top_k, per_file_min)]
+               for position in range(len(queries))]
+    return results, missing
+
+
+async def search_sharded(query: str, filenames: list, top_k: int = 50, mode: str = None) -> list:
+    return (await search_sharded_batch([query], filenames, top_k, mode))[0][0]
+
+
+async def encode_for_shards(queries, wanted):
+    positions = [position for position, want in enumerate(wanted) if want]
+    vectors = [None] * len(queries)
+    if positions:
+        query_vecs = await embedding_executor.run(encode_queries, [queries[position] for position in positions])
+        for position, vector in zip(positions, query_vecs):
+            vectors[position] = vector.tolist()
+    return vectors
+
+
+async def forward_upload(filename: str, contents: bytes) -> dict:
+    # the owning shard ingests the file; returns its per-file status entry
+    node = ring.owner(filename)
+    response = await get_client().post(f"{node}/upload/", files=[("files", (filename, contents, "application/pdf"))],
+                                       timeout=SHARD_UPLOAD_TIMEOUT)
+    response.raise_for_status()
+    return dict(response.json()["uploaded_files_info"][0], shard=node)
+
+
+async def forward_document(method: str, filename: str, contents: bytes = None) -> httpx.Response:
+    # DELETE / PUT /documents/{filename} on the owning shard
+    files = [("file", (filename, contents, "application/pdf"))] if contents is not None else None
+    return await get_client().request(method, f"{ring.owner(filename)}/documents/{quote(filename, safe='')}", files=files,
+                                      timeout=SHARD_UPLOAD_TIMEOUT)
+
+
+async def forward_chunk(filename: str, start: int, end: int) -> httpx.Response:
+    return await get_client().get(f"{ring.owner(filename)}/chunk/", params={"filename": filename, "start": start, "end": end})
+
+
+async def shard_index_version(filenames: list) -> str:
+    # combines the owning shards' versions; an unreachable shard counts as a version of its own
+    by_node = ring.group(filenames)
+    nodes = sorted(by_node)
+    answers = await asyncio.gather(*(get_client().get(f"{node}/index/version/", params={"files": by_node[node]})
+                                     for node in nodes), return_exceptions=True)
+    parts = []
+    for node, response in zip(nodes, answers):
+        if isinstance(response, Exception) or response.status_code != 200:
+            parts.append(f"{node}:unavailable")
+        else:
+            parts.append(f"{node}:{response.json()['index_version']}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+async def clear_shards() -> list:
+    # nodes that failed to clear
+    answers = await fan_out({node: {} for node in SHARD_NODES}, "/clear/", SHARD_CLEAR_TIMEOUT)
+    return [node for node in SHARD_NODES if node not in answers]
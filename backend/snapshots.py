@@ -0,0 +1,270 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import time
+import uuid
+
+from embeddings import INDEX_DIR, INDEX_INFO_PATH, index_lock, ensure_index_info, load_index_info, check_index_info, replace_file
+from observability import logger
+
+# Portable snapshots of the index directory, so a new replica can start serving without
+# re-extracting and re-embedding every PDF.
+#
+# A snapshot is an uncompressed tar (vectors don't compress) holding manifest.json and the
+# index files under index/. The manifest records the embedding model, dimension and chunking
+# parameters (index_info.json) and a sha256 per file. A delta snapshot names its base snapshot,
+# carries only the files that changed since then and lists the ones that were removed; its
+# manifest still describes the complete resulting state.
+#
+# Importing verifies every checksum into a staging directory before anything is swapped in,
+# refuses bundles made with a different model or dimension, and refuses a delta unless this
+# node's last imported or exported snapshot is its base.
+#
+#   python snapshots.py export [--base SNAPSHOT_ID]
+#   python snapshots.py import data/snapshots/snapshot-<id>.tar
+#   python snapshots.py list
+
+SNAPSHOT_DIR = "data/snapshots"
+SNAPSHOT_FORMAT_VERSION = 1
+# last snapshot exported from or imported into this index directory
+SNAPSHOT_STATE_PATH = os.path.join(INDEX_DIR, "snapshot_state.json")
+# fetched and imported on startup when this node has no index yet (path or http(s) URL)
+SNAPSHOT_SOURCE = os.getenv("SNAPSHOT_SOURCE", "")
+
+HASH_BLOCK = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def bundle_path(snapshot_id: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"snapshot-{snapshot_id}.tar")
+
+
+def manifest_path(snapshot_id: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"snapshot-{snapshot_id}.json")
+
+
+def read_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: str, data):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+    replace_file(path, write)
+
+
+def index_files() -> list:
+    # names of the files that make up the index; temp files and snapshot bookkeeping excluded
+    if not os.path.isdir(INDEX_DIR):
+        return []
+    return sorted(name for name in os.listdir(INDEX_DIR)
+                  if os.path.isfile(os.path.join(INDEX_DIR, name))
+                  and not name.endswith(".tmp") and name != os.path.basename(SNAPSHOT_STATE_PATH))
+
+
+def freeze_index(target_dir: str) -> list:
+    # a consistent point-in-time copy: writers replace files rather than rewrite them in place,
+    # so hard links taken under index_lock stay unchanged however long the export takes
+    os.makedirs(target_dir, exist_ok=True)
+    with index_lock:
+        names = index_files()
+        for name in names:
+            try:
+                os.link(os.path.join(INDEX_DIR, name), os.path.join(target_dir, name))
+            except OSError:
+                shutil.copy2(os.path.join(INDEX_DIR, name), os.path.join(target_dir, name))
+    return names
+
+
+def export_snapshot(base_id: str = None) -> dict:
+    base = None
+    if base_id:
+        base = read_json(manifest_path(base_id))
+        if base is None:
+            raise ValueError(f"Base snapshot {base_id} not found")
+
+    snapshot_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    frozen_dir = os.path.join(SNAPSHOT_DIR, f".export-{snapshot_id}")
+    try:
+        ensure_index_info()
+        names = freeze_index(frozen_dir)
+        files = {name: {"sha256": file_sha256(os.path.join(frozen_dir, name)),
+                        "bytes": os.path.getsize(os.path.join(frozen_dir, name))} for name in names}
+        if base is None:
+            included = names
+            deleted = []
+        else:
+            included = [name for name in names if base["files"].get(name, {}).get("sha256") != files[name]["sha256"]]
+            deleted = sorted(set(base["files"]) - set(files))
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "snapshot_id": snapshot_id,
+            "base": base_id,
+            "created": time.time(),
+            "index_info": load_index_info(),
+            "files": files,
+            "included": included,
+            "deleted": deleted,
+        }
+
+        tmp_path = f"{bundle_path(snapshot_id)}.tmp"
+        with tarfile.open(tmp_path, "w") as tar:
+            manifest_bytes = json.dumps(manifest, indent=2).encode("utf-8")
+            info = tarfile.TarInfo("manifest.json")
+            info.size = len(manifest_bytes)
+            info.mtime = int(manifest["created"])
+            tar.addfile(info, fileobj=io.BytesIO(manifest_bytes))
+            for name in included:
+                tar.add(os.path.join(frozen_dir, name), arcname=f"index/{name}")
+        os.replace(tmp_path, bundle_path(snapshot_id))
+    finally:
+        shutil.rmtree(frozen_dir, ignore_errors=True)
+
+    write_json(manifest_path(snapshot_id), manifest)
+    write_json(SNAPSHOT_STATE_PATH, {"snapshot_id": snapshot_id})
+    logger.info("Exported snapshot %s: %d of %d files, %d deleted", snapshot_id, len(included), len(files), len(deleted))
+    return summarize(manifest)
+
+
+def summarize(manifest: dict) -> dict:
+    return {
+        "snapshot_id": manifest["snapshot_id"],
+        "base": manifest["base"],
+        "created": manifest["created"],
+        "model": manifest["index_info"].get("model"),
+        "files": len(manifest["files"]),
+        "included": len(manifest["included"]),
+        "deleted": len(manifest["deleted"]),
+        "bytes": sum(manifest["files"][name]["bytes"] for name in manifest["included"]),
+    }
+
+
+def list_snapshots() -> list:
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(SNAPSHOT_DIR)):
+        if name.startswith("snapshot-") and name.endswith(".json"):
+            snapshots.append(summarize(read_json(os.path.join(SNAPSHOT_DIR, name))))
+    return snapshots
+
+
+def import_snapshot(path: str) -> dict:
+    with tarfile.open(path, "r") as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {manifest.get('format_version')}")
+        check_index_info(manifest["index_info"])
+
+        state = read_json(SNAPSHOT_STATE_PATH) or {}
+        if manifest["base"] and state.get("snapshot_id") != manifest["base"]:
+            raise ValueError(f"Delta snapshot {manifest['snapshot_id']} needs base {manifest['base']}, "
+                             f"this node is at {state.get('snapshot_id')}")
+
+        # everything is extracted and verified before the live index is touched
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        staging_dir = os.path.join(INDEX_DIR, f".import-{manifest['snapshot_id']}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        try:
+            for name in manifest["included"]:
+                if os.path.basename(name) != name:
+                    raise ValueError(f"Unexpected file name in snapshot: {name}")
+                member = tar.extractfile(f"index/{name}")
+                staged_path = os.path.join(staging_dir, name)
+                digest = hashlib.sha256()
+                with open(staged_path, "wb") as f:
+                    for block in iter(lambda: member.read(HASH_BLOCK), b""):
+                        digest.update(block)
+                        f.write(block)
+                if digest.hexdigest() != manifest["files"][name]["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {name} in snapshot {manifest['snapshot_id']}")
+
+            missing = [name for name in manifest["files"]
+                       if name not in manifest["included"] and not os.path.exists(os.path.join(INDEX_DIR, name))]
+            if missing:
+                raise ValueError(f"Snapshot {manifest['snapshot_id']} expects files this node doesn't have: {missing[:5]}")
+
+            with index_lock:
+                if not manifest["base"]:
+                    stale = set(index_files()) - set(manifest["files"])
+                else:
+                    stale = set(manifest["deleted"])
+                for name in manifest["included"]:
+                    os.replace(os.path.join(staging_dir, name), os.path.join(INDEX_DIR, name))
+                for name in stale:
+                    if os.path.exists(os.path.join(INDEX_DIR, name)):
+                        os.remove(os.path.join(INDEX_DIR, name))
+                write_json(SNAPSHOT_STATE_PATH, {"snapshot_id": manifest["snapshot_id"]})
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    logger.info("Imported snapshot %s: %d files, %d deleted", manifest["snapshot_id"], len(manifest["included"]), len(manifest["deleted"]))
+    return summarize(manifest)
+
+
+def fetch_snapshot(source: str) -> str:
+    # local path of the bundle, downloading it first if source is a URL
+    if not source.startswith(("http://", "https://")):
+        return source
+    import httpx
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, f".download-{uuid.uuid4().hex[:6]}.tar")
+    with httpx.stream("GET", source, timeout=600, follow_redirects=True) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for block in response.iter_bytes(HASH_BLOCK):
+                f.write(block)
+    return path
+
+
+def fetch_and_import(source: str) -> dict:
+    path = fetch_snapshot(source)
+    try:
+        return import_snapshot(path)
+    finally:
+        if path != source:
+            os.remove(path)
+
+
+def import_on_startup():
+    # a fresh replica warm-starts from SNAPSHOT_SOURCE; a node that already has an index keeps it
+    if not SNAPSHOT_SOURCE or os.path.exists(INDEX_INFO_PATH):
+        return None
+    return fetch_and_import(SNAPSHOT_SOURCE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("--base", help="snapshot id to export a delta against")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("source", help="snapshot bundle path or URL")
+    commands.add_parser("list")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export_snapshot(args.base), indent=2))
+    elif args.command == "import":
+        print(json.dumps(fetch_and_import(args.source), indent=2))
+    else:
+        print(json.dumps(list_snapshots(), indent=2))
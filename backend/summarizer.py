@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from embeddings import load_individual_index, load_document_refs, load_document_text, is_deleted, replace_file
+from chunking import chunk_text_from_span
+from llm import build_section_summary_prompt, build_reduce_summary_prompt, build_single_summary_prompt, generate_answer_for_summary, SUMMARY_ERROR
+from observability import logger, record_cache
+
+# Hierarchical (map-reduce) summaries of whole documents.
+#
+# A document's stored chunks, in reading order, are packed into groups of up to
+# SUMMARY_GROUP_CHARS and each group is summarized (map). The partial summaries are packed and
+# merged the same way, round after round, until one group is left; that one gets the regular
+# single-document summary prompt. All LLM calls share a SUMMARY_CONCURRENCY cap.
+#
+# Every node is cached under SUMMARY_DIR by a hash of its prompt, so its key covers exactly the
+# text it summarizes: re-uploads and documents that share sections reuse what was already
+# summarized, and only the groups that changed (plus the nodes above them) cost new calls.
+
+SUMMARY_DIR = "data/summaries"
+SUMMARY_GROUP_CHARS = int(os.getenv("SUMMARY_GROUP_CHARS", "6000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_CACHE_VERSION = "1"  # bump to invalidate cached summaries (e.g. when the LLM changes)
+SEPARATOR = "\n---\n"
+
+_llm_slots = None
+_in_flight = {}  # cache key -> task, so concurrent requests for the same node share one call
+
+
+def document_sections(filename: str) -> list:
+    # the document's stored chunks in reading order, corpus-deduplicated ones included, as text
+    if is_deleted(filename):
+        return []
+    _, metadata = load_individual_index(filename)
+    items = [item for item in metadata if not item.get("deleted")] + load_document_refs(filename)
+    items.sort(key=lambda item: (item.get("start", 0), item.get("chunk_index", 0)))
+    text = load_document_text(filename)
+    sections = []
+    for item in items:
+        if "start" in item and text is not None:
+            sections.append(chunk_text_from_span(text, item["start"], item["end"]))
+        elif "chunk" in item:
+            sections.append(item["chunk"])
+    return [section for section in sections if section.strip()]
+
+
+def pack(texts: list, max_chars: int, min_items: int = 1) -> list:
+    # consecutive texts grouped up to max_chars; min_items > 1 guarantees every reduce round shrinks
+    groups = []
+    group, size = [], 0
+    for text in texts:
+        if group and size + len(text) + len(SEPARATOR) > max_chars and len(group) >= min_items:
+            groups.append(group)
+            group, size = [], 0
+        group.append(text)
+        size += len(text) + len(SEPARATOR)
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(SUMMARY_DIR, key[:2], f"{key}.json")
+
+
+def read_cached_summary(key: str):
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["summary"]
+    except Exception as e:
+        logger.warning("Error reading cached summary %s: %s", key, e)
+        return None
+
+
+def write_cached_summary(key: str, summary: str):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary}, f)
+    replace_file(path, write)
+
+
+async def cached_summary(prompt: str) -> str:
+    key = hashlib.sha256(f"{SUMMARY_CACHE_VERSION}\n{prompt}".encode("utf-8")).hexdigest()
+    summary = await asyncio.to_thread(read_cached_summary, key)
+    record_cache("summary", summary is not None)
+    if summary is not None:
+        return summary
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_and_store(key, prompt))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _generate_and_store(key: str, prompt: str) -> str:
+    global _llm_slots
+    if _llm_slots is None:
+        _llm_slots = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    async with _llm_slots:
+        summary = await generate_answer_for_summary(prompt)
+    if summary != SUMMARY_ERROR:  # failures are returned, never cached
+        await asyncio.to_thread(write_cached_summary, key, summary)
+    return summary
+
+
+async def final_summary(query: str, texts: list) -> str:
+    max_chars = sum(len(text) + len(SEPARATOR) for text in texts)
+    return await cached_summary(build_single_summary_prompt(query, [{"chunk": text} for text in texts], max_chars=max_chars))
+
+
+async def summarize_sections(sections: list, query: str = "summarize this document") -> str:
+    groups = pack(sections, SUMMARY_GROUP_CHARS)
+    if len(groups) == 1:
+        return await final_summary(query, groups[0])
+
+    partials = await asyncio.gather(*(cached_summary(build_section_summary_prompt(SEPARATOR.join(group))) for group in groups))
+    while True:
+        if SUMMARY_ERROR in partials:
+            return SUMMARY_ERROR
+        groups = pack(partials, SUMMARY_GROUP_CHARS, min_items=2)
+        if len(groups) == 1:
+            return await final_summary(query, groups[0])
+        partials = await asyncio.gather(*(cached_summary(build_reduce_summary_prompt(group)) for group in groups))
@@ -0,0 +1,49 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embeddings
+
+
+def paragraph(seed, words=90):
+    # one line, long enough to be a chunk of its own, with a vocabulary of its own
+    rng = random.Random(seed)
+    vocabulary = [f"term{seed}x{i}" for i in range(40)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    # the backend writes to relative data/ paths
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(embeddings.INDEX_DIR)
+    monkeypatch.setattr(embeddings, "DEDUP_ACROSS_CORPUS", True)
+
+
+def test_borrowed_chunk_survives_replace_of_its_owner(corpus):
+    shared = paragraph(1)
+    embeddings.embed_and_store_document("a.pdf", "\n".join([paragraph(2), shared]))
+    embeddings.embed_and_store_document("b.pdf", "\n".join([paragraph(3), shared]))
+    assert [ref["filename"] for ref in embeddings.load_document_refs("b.pdf")] == ["a.pdf"]
+
+    # a.pdf is replaced without the shared chunk: its row stays behind, tombstoned, for b.pdf
+    stats = embeddings.embed_and_store_document("a.pdf", "\n".join([paragraph(2), paragraph(4)]))
+    assert stats["tombstoned"] == 1
+
+    results = embeddings.search_unified_batch([shared], ["a.pdf", "b.pdf"], top_k=5, mode="dense")[0]
+    borrowed = [item for item in results if item["chunk"] == shared]
+    assert [(item["filename"], item.get("duplicate_of")) for item in borrowed] == [("b.pdf", "a.pdf")]
+    assert not any(item.get("deleted") for item in results)
+
+
+def test_borrowed_chunk_matches_lexically(corpus):
+    shared = paragraph(1)
+    embeddings.embed_and_store_document("a.pdf", "\n".join([paragraph(2), shared]))
+    embeddings.embed_and_store_document("b.pdf", "\n".join([paragraph(3), shared]))
+
+    results = embeddings.search_unified_batch([" ".join(shared.split()[:2])], ["b.pdf"], top_k=5, mode="lexical")[0]
+    assert [(item["filename"], item.get("duplicate_of")) for item in results] == [("b.pdf", "a.pdf")]
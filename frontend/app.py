@@ -1,112 +1,125 @@
-import streamlit as st
-import requests
-import time
-import logging
-
-st.set_page_config(page_title="docInsight", layout="wide")
-st.title("📚 docInsight")
-
-backend_url = "http://backend:8000"
-
-for _ in range(10):
-    try:
-        r = requests.get(f"{backend_url}/health")
-        if r.status_code == 200:
-            break
-    except requests.exceptions.ConnectionError:
-        time.sleep(1)
-else:
-    st.error("❌ Cannot connect to the backend API. Please make sure it is running.")
-    st.stop()
-
-if "files" not in st.session_state:
-    st.session_state.files = []
-
-# File uploader
-st.subheader("1️⃣ Upload your PDF files")
-uploaded_files = st.file_uploader("Choose PDF files", type=["pdf"], accept_multiple_files=True)
-
-if uploaded_files:
-    with st.spinner("Uploading and processing files..."):
-        files = [("files", (f.name, f, "application/pdf")) for f in uploaded_files]
-        response = requests.post(f"{backend_url}/upload/", files=files)
-        if response.status_code == 200:
-            new_files = [f["filename"] for f in response.json()["uploaded_files_info"]]
-            st.session_state["files"].extend(f for f in new_files if f not in st.session_state["files"])
-            st.success(f"Uploaded and indexed: {', '.join(new_files)}")
-        else:
-            st.error(f"Upload failed: {response.text}")
-
-# uploaded_file = st.file_uploader("Choose a PDF file", type=["pdf"], accept_multiple_files=False)
-
-# if uploaded_file:
-#     with st.spinner("Uploading and processing file..."):
-#         files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
-#         response = requests.post(f"{backend_url}/upload/", files=files)
-#         if response.status_code == 200:
-#             st.success(f"Uploaded and indexed: {response.json()['filename']}")
-#         else:
-#             st.error(f"Upload failed: {response.text}")
-
-
-
-st.subheader("2️⃣ Select documents to search")
-selected_files = st.multiselect("✅ Choose documents", st.session_state["files"], default=st.session_state["files"])
-
-if st.button("Clear all data"):
-    response = requests.post(f"{backend_url}/clear/")
-    if response.status_code == 200:
-        st.session_state["files"] = []
-        st.success("Cleared all data successfully!")
-    else:
-        st.error(f"Failed to clear data: {response.text}")
-
-
-# Query interface
-st.subheader("2️⃣ Ask a question about your selected documents")
-query = st.text_input("Type your question here")
-
-if query and selected_files:
-    with st.spinner("Searching and generating answer..."):
-        # res = requests.post(f"{backend_url}/query/", data={"query": query}, files={"files": selected_files})
-        data = [("query", query)] + [("files", f) for f in selected_files]
-        response = requests.post(f"{backend_url}/query/", data=data)
-        if response.status_code == 200:
-            result = response.json()
-            query_type = result.get("query_type", "normal")
-            st.markdown("### ✅ Answer")
-            st.write(result["answer"])
-            st.text(f">> Query type: {query_type}")
-            # print(f"\n\n>>  Query type: {query_type}\n\n")
-            st.markdown("### 📄 Sources")
-            for i, src in enumerate(result["sources"], 1):
-                st.markdown(f"**{i}. {src['filename']}**")
-                if query_type == "summary":
-                    st.markdown("#### Summary")
-                    st.code(src["chunk"], language="markdown")
-                    
-                    if "original_chunks" in src:
-                        with st.expander("Show original source from documents"):
-                            for j, chunk in enumerate(src["original_chunks"], 1):
-                                st.markdown(f"**{j}.**")
-                                st.code(chunk, language="markdown")
-
-                elif query_type == "comparison":
-                    if "chunk" in src:
-                        st.markdown("#### Comparison")
-                        st.code(src["chunk"], language="markdown")
-                    if "original_chunks" in src:
-                        with st.expander("Show original source from documents"):
-                            for j, chunk in enumerate(src["original_chunks"], 1):
-                                st.markdown(f"**{j}.**")
-                                st.code(chunk, language="markdown")
-                
-                else:
-                    if "chunk" in src:
-                        st.markdown("#### Context")
-                        st.code(src["chunk"], language="markdown")
-
-        else:
-            st.error(f"Error: {response.text}")
-else:
+import streamlit as st
+import logging
+
+import backend_client
+from backend_client import BackendError
+
+st.set_page_config(page_title="docInsight", layout="wide")
+st.title("📚 docInsight")
+
+try:
+    backend_client.check_health()
+except BackendError:
+    st.error("❌ Cannot connect to the backend API. Please make sure it is running.")
+    st.stop()
+
+def fetch_chunk_text(src, index_version):
+    # /query/ returns citations (file, page, span); the text behind them is fetched on demand
+    if "chunk" in src:
+        return src["chunk"]
+    try:
+        return backend_client.fetch_chunk(src["filename"], src["start"], src["end"], index_version)
+    except BackendError:
+        return None
+
+if "files" not in st.session_state:
+    st.session_state.files = []
+if "uploaded" not in st.session_state:
+    st.session_state.uploaded = set()  # (name, size) of files already sent, the uploader keeps them across reruns
+
+# File uploader
+st.subheader("1️⃣ Upload your PDF files")
+uploaded_files = st.file_uploader("Choose PDF files", type=["pdf"], accept_multiple_files=True)
+
+pending_files = [f for f in uploaded_files or [] if (f.name, f.size) not in st.session_state["uploaded"]]
+if pending_files:
+    with st.spinner("Uploading and processing files..."):
+        try:
+            uploaded_info = backend_client.upload_files([(f.name, f) for f in pending_files])
+            new_files = [f["filename"] for f in uploaded_info]
+            st.session_state["files"].extend(f for f in new_files if f not in st.session_state["files"])
+            st.session_state["uploaded"].update((f.name, f.size) for f in pending_files)
+            st.success(f"Uploaded and indexed: {', '.join(new_files)}")
+        except BackendError as e:
+            st.error(f"Upload failed: {e}")
+
+# uploaded_file = st.file_uploader("Choose a PDF file", type=["pdf"], accept_multiple_files=False)
+
+# if uploaded_file:
+#     with st.spinner("Uploading and processing file..."):
+#         files = {"file": (uploaded_file.name, uploaded_file, "application/pdf")}
+#         response = requests.post(f"{backend_url}/upload/", files=files)
+#         if response.status_code == 200:
+#             st.success(f"Uploaded and indexed: {response.json()['filename']}")
+#         else:
+#             st.error(f"Upload failed: {response.text}")
+
+
+
+st.subheader("2️⃣ Select documents to search")
+selected_files = st.multiselect("✅ Choose documents", st.session_state["files"], default=st.session_state["files"])
+
+if st.button("Clear all data"):
+    try:
+        backend_client.clear_data()
+        st.session_state["files"] = []
+        st.session_state["uploaded"] = set()
+        st.success("Cleared all data successfully!")
+    except BackendError as e:
+        st.error(f"Failed to clear data: {e}")
+
+
+# Query interface
+st.subheader("2️⃣ Ask a question about your selected documents")
+query = st.text_input("Type your question here")
+
+if query and selected_files:
+    with st.spinner("Searching and generating answer..."):
+        # reruns with the same question and selection are answered from the cache
+        files = tuple(sorted(selected_files))
+        try:
+            index_version = backend_client.get_index_version(files)
+            result = backend_client.run_query(query, files, index_version)
+        except BackendError as e:
+            result = None
+            st.error(f"Error: {e}")
+        if result is not None:
+            query_type = result.get("query_type", "normal")
+            st.markdown("### ✅ Answer")
+            st.write(result["answer"])
+            st.text(f">> Query type: {query_type}")
+            # print(f"\n\n>>  Query type: {query_type}\n\n")
+            st.markdown("### 📄 Sources")
+            for i, src in enumerate(result["sources"], 1):
+                page = f" (page {src['page']})" if "page" in src else ""
+                st.markdown(f"**{i}. {src['filename']}**{page}")
+                if query_type == "summary":
+                    st.markdown("#### Summary")
+                    st.code(src.get("summary_chunk", ""), language="markdown")
+                    
+                    if "original_chunks" in src:
+                        with st.expander("Show original source from documents"):
+                            for j, chunk in enumerate(src["original_chunks"], 1):
+                                st.markdown(f"**{j}.**")
+                                st.code(chunk, language="markdown")
+
+                elif query_type == "comparison":
+                    if "summary_chunk" in src:
+                        st.markdown("#### Comparison")
+                        st.code(src["summary_chunk"], language="markdown")
+                    elif "start" in src or "chunk" in src:
+                        if st.checkbox("Show context", key=f"context_{i}"):
+                            st.code(fetch_chunk_text(src, index_version) or "Text not available.", language="markdown")
+                    if "original_chunks" in src:
+                        with st.expander("Show original source from documents"):
+                            for j, chunk in enumerate(src["original_chunks"], 1):
+                                st.markdown(f"**{j}.**")
+                                st.code(chunk, language="markdown")
+                
+                else:
+                    if "start" in src or "chunk" in src:
+                        if st.checkbox("Show context", key=f"context_{i}"):
+                            st.code(fetch_chunk_text(src, index_version) or "Text not available.", language="markdown")
+
+else:
     st.warning("Type a question and select documents to search.")
\ No newline at end of file
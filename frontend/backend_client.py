@@ -0,0 +1,101 @@
+import os
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Thin client for the backend API.
+#
+# One pooled requests.Session is shared by every script run and browser session, so reruns
+# reuse keep-alive connections. Answers and chunk texts are cached with st.cache_data, keyed on
+# the query, the selected files and the index version of those files: a rerun with the same
+# question and selection is served from the cache, and re-uploading, deleting or clearing a
+# document changes the version, so the next run asks the backend again. Failed calls raise
+# BackendError and are never cached.
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
+
+CONNECT_TIMEOUT = 3.05
+HEALTH_TIMEOUT = 2
+QUERY_TIMEOUT = 300  # retrieval + several LLM calls for summaries
+UPLOAD_TIMEOUT = 600  # extraction and embedding of every uploaded file
+DEFAULT_TIMEOUT = 30
+
+HEALTH_TTL = 30  # seconds a successful health check is trusted
+VERSION_TTL = 10  # seconds before another client's uploads are noticed
+QUERY_TTL = 3600
+
+
+class BackendError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    session = requests.Session()
+    # only idempotent requests are retried; a retried /query/ would pay for the LLM twice
+    retries = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _request(method, path, timeout=DEFAULT_TIMEOUT, **kwargs):
+    try:
+        response = get_session().request(method, f"{BACKEND_URL}{path}", timeout=(CONNECT_TIMEOUT, timeout), **kwargs)
+    except requests.exceptions.RequestException as e:
+        raise BackendError(f"Backend request failed: {e}")
+    if response.status_code != 200:
+        raise BackendError(response.text, response.status_code)
+    return response.json()
+
+
+@st.cache_data(ttl=HEALTH_TTL, show_spinner=False)
+def check_health(attempts: int = 10) -> bool:
+    # waits for a starting backend; only a healthy answer is cached, failures raise
+    for attempt in range(attempts):
+        try:
+            _request("GET", "/health", timeout=HEALTH_TIMEOUT)
+            return True
+        except BackendError:
+            if attempt + 1 < attempts:
+                time.sleep(1)
+    raise BackendError("Cannot connect to the backend API")
+
+
+@st.cache_data(ttl=VERSION_TTL, show_spinner=False)
+def get_index_version(files: tuple) -> str:
+    return _request("GET", "/index/version/", params={"files": list(files)})["index_version"]
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=256, show_spinner=False)
+def run_query(query: str, files: tuple, index_version: str) -> dict:
+    # index_version is only part of the cache key
+    data = [("query", query)] + [("files", f) for f in files]
+    return _request("POST", "/query/", timeout=QUERY_TIMEOUT, data=data)
+
+
+@st.cache_data(ttl=QUERY_TTL, max_entries=1024, show_spinner=False)
+def fetch_chunk(filename: str, start: int, end: int, index_version: str) -> str:
+    return _request("GET", "/chunk/", params={"filename": filename, "start": start, "end": end})["chunk"]
+
+
+def upload_files(files: list) -> list:
+    # files: [(name, file object)]
+    payload = [("files", (name, f, "application/pdf")) for name, f in files]
+    try:
+        return _request("POST", "/upload/", timeout=UPLOAD_TIMEOUT, files=payload)["uploaded_files_info"]
+    finally:
+        get_index_version.clear()
+
+
+def clear_data() -> dict:
+    try:
+        return _request("POST", "/clear/")
+    finally:
+        get_index_version.clear()